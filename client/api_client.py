@@ -1,19 +1,21 @@
-import httpx
+import sys
+from pathlib import Path
 
+# modulo HTTP condiviso dai tre client (cartella client_common accanto a questa)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from client_common.http_client import HTTPClientBase  # noqa: E402
 
-class APIClient:
-    def __init__(self, base_url="http://127.0.0.1:8000"):
-        self.base_url = base_url
 
+class APIClient(HTTPClientBase):
     def lista_codici(self):
         """Ottiene tutti i codici rilasciati dal server"""
-        r = httpx.get(f"{self.base_url}/codici/")
+        r = self._get(f"{self.base_url}/codici/")
         r.raise_for_status()
         return r.json()
 
     def cerca_codice(self, codice):
         """Cerca un singolo codice rilasciato"""
-        r = httpx.get(f"{self.base_url}/codici/{codice}")
+        r = self._http_get(f"{self.base_url}/codici/{codice}")
         if r.status_code == 404:
             return None
         r.raise_for_status()
@@ -30,12 +32,12 @@ class APIClient:
         }
         if stato:
             payload["stato"] = stato
-        r = httpx.post(f"{self.base_url}/codici/", json=payload)
+        r = self._http.post(f"{self.base_url}/codici/", json=payload)
         r.raise_for_status()
         return r.json()
 
     def lista_stati(self):
-        r = httpx.get(f"{self.base_url}/stati/")
+        r = self._http_get(f"{self.base_url}/stati/")
         r.raise_for_status()
         return r.json()
 
@@ -46,13 +48,13 @@ class APIClient:
             "figlio": figlio,
             "quantita": quantita,
         }
-        r = httpx.post(f"{self.base_url}/distinte/", params=params)
+        r = self._http.post(f"{self.base_url}/distinte/", params=params)
         r.raise_for_status()
         return r.json()
 
     def distinta(self, codice):
         """Recupera la distinta base di un codice"""
-        r = httpx.get(f"{self.base_url}/distinte/{codice}")
+        r = self._get(f"{self.base_url}/distinte/{codice}")
         if r.status_code == 404:
             return []
         r.raise_for_status()
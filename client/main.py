@@ -328,4 +328,5 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = PLMClient()
     window.show()
+    app.aboutToQuit.connect(window.api.close)
     sys.exit(app.exec())
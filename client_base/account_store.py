@@ -5,7 +5,7 @@ from typing import Dict, Optional
 
 CONFIG_DIR = Path.home() / ".plm_client"
 CONFIG_FILE = CONFIG_DIR / "account.json"
-DEFAULT_CONFIG = {"account": None, "font_scale": 1.0, "credentials": None}
+DEFAULT_CONFIG = {"account": None, "font_scale": 1.0, "credentials": None, "session": None}
 
 
 def _read_config() -> Dict:
@@ -32,6 +32,7 @@ def _write_config(config: Dict) -> None:
         "account": config.get("account"),
         "font_scale": config.get("font_scale", DEFAULT_CONFIG["font_scale"]),
         "credentials": config.get("credentials"),
+        "session": config.get("session"),
     }
     with CONFIG_FILE.open("w", encoding="utf-8") as handle:
         json.dump(payload, handle, ensure_ascii=True, indent=2)
@@ -66,6 +67,7 @@ def clear_account_context() -> None:
     config = _read_config()
     config["account"] = None
     config["credentials"] = None
+    config["session"] = None
     _write_config(config)
 
 
@@ -104,3 +106,15 @@ def load_account_password() -> Optional[str]:
         return base64.b64decode(encoded.encode("ascii")).decode("utf-8")
     except Exception:
         return None
+
+
+def save_refresh_token(token: str) -> None:
+    config = _read_config()
+    config["session"] = {"refresh_token": token} if token else None
+    _write_config(config)
+
+
+def load_refresh_token() -> Optional[str]:
+    config = _read_config()
+    session = config.get("session") or {}
+    return session.get("refresh_token") or None
@@ -1,10 +1,16 @@
-import httpx
+import sys
+import time
+from pathlib import Path
 from typing import Dict, Optional
 
+# modulo HTTP condiviso dai tre client (cartella client_common accanto a questa)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from client_common.http_client import HTTPClientBase  # noqa: E402
 
-class APIClient:
-    def __init__(self, base_url="http://127.0.0.1:8000"):
-        self.base_url = base_url
+
+class APIClient(HTTPClientBase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self._account_context: Optional[Dict[str, str]] = None
 
     def set_account_context(self, context: Optional[Dict[str, str]]):
@@ -16,17 +22,40 @@ class APIClient:
     def _auth_headers(self) -> Dict[str, str]:
         if not self._account_context or not self._account_context.get("header"):
             raise RuntimeError("Nessun account selezionato.")
-        return {"X-PLM-Account": self._account_context["header"]}
+        context = self._account_context
+        if context.get("access_token"):
+            # rinnova il token poco prima della scadenza, senza richiedere la password
+            if context.get("refresh_token") and context.get("expires_at", 0) - time.time() < 60:
+                self.set_account_context(self.refresh_session(context["refresh_token"]))
+                context = self._account_context
+            return {"Authorization": f"Bearer {context['access_token']}"}
+        return {"X-PLM-Account": context["header"]}
 
     def lista_codici(self):
         """Ottiene tutti i codici rilasciati dal server"""
-        r = httpx.get(f"{self.base_url}/codici/")
+        r = self._get(f"{self.base_url}/codici/")
+        r.raise_for_status()
+        return r.json()
+
+    def pagina_codici(self, filtri=None, cursor=None, limit=200, ordina="codice", direzione="asc"):
+        """Recupera una pagina di codici filtrata lato server (keyset su `next_cursor`)"""
+        params = {k: v for k, v in (filtri or {}).items() if v not in (None, "")}
+        params.update({"limit": limit, "ordina": ordina, "direzione": direzione})
+        if cursor:
+            params["cursor"] = cursor
+        r = self._get(f"{self.base_url}/codici/", params=params)
+        r.raise_for_status()
+        return r.json()
+
+    def ricerca_codici(self, testo, limit=20):
+        """Ricerca full-text lato server su codice, descrizione e ubicazione"""
+        r = self._http_get(f"{self.base_url}/codici/search", params={"q": testo, "limit": limit})
         r.raise_for_status()
         return r.json()
 
     def cerca_codice(self, codice):
         """Cerca un singolo codice rilasciato"""
-        r = httpx.get(f"{self.base_url}/codici/{codice}")
+        r = self._http_get(f"{self.base_url}/codici/{codice}")
         if r.status_code == 404:
             return None
         r.raise_for_status()
@@ -43,12 +72,12 @@ class APIClient:
         }
         if stato:
             payload["stato"] = stato
-        r = httpx.post(f"{self.base_url}/codici/", json=payload, headers=self._auth_headers())
+        r = self._http.post(f"{self.base_url}/codici/", json=payload, headers=self._auth_headers())
         r.raise_for_status()
         return r.json()
 
     def lista_stati(self):
-        r = httpx.get(f"{self.base_url}/stati/")
+        r = self._http_get(f"{self.base_url}/stati/")
         r.raise_for_status()
         return r.json()
 
@@ -59,20 +88,29 @@ class APIClient:
             "figlio": figlio,
             "quantita": quantita,
         }
-        r = httpx.post(f"{self.base_url}/distinte/", params=params, headers=self._auth_headers())
+        r = self._http.post(f"{self.base_url}/distinte/", params=params, headers=self._auth_headers())
         r.raise_for_status()
         return r.json()
 
     def distinta(self, codice):
         """Recupera la distinta base di un codice"""
-        r = httpx.get(f"{self.base_url}/distinte/{codice}")
+        r = self._get(f"{self.base_url}/distinte/{codice}")
         if r.status_code == 404:
             return []
         r.raise_for_status()
         return r.json()
 
+    def modifiche(self, since=None, limit=1000):
+        """Registro modifiche successive al cursore (senza cursore: solo il cursore corrente)"""
+        params = {"limit": limit}
+        if since is not None:
+            params["since"] = since
+        r = self._http_get(f"{self.base_url}/changes", params=params)
+        r.raise_for_status()
+        return r.json()
+
     def lista_account_hierarchy(self):
-        r = httpx.get(f"{self.base_url}/auth/accounts")
+        r = self._http_get(f"{self.base_url}/auth/accounts")
         r.raise_for_status()
         return r.json()
 
@@ -83,17 +121,23 @@ class APIClient:
             "account": account,
             "password": password,
         }
-        r = httpx.post(f"{self.base_url}/auth/login", json=payload)
+        r = self._http.post(f"{self.base_url}/auth/login", json=payload)
+        r.raise_for_status()
+        return r.json()
+
+    def refresh_session(self, refresh_token: str):
+        """Nuovi token di sessione a partire dal refresh token salvato (nessuna password)"""
+        r = self._http.post(f"{self.base_url}/auth/refresh", json={"refresh_token": refresh_token})
         r.raise_for_status()
         return r.json()
 
     def crea_account_login(self, account: str, password: str):
         payload = {"account": account, "password": password}
-        r = httpx.post(f"{self.base_url}/auth/accounts", json=payload)
+        r = self._http.post(f"{self.base_url}/auth/accounts", json=payload)
         r.raise_for_status()
         return r.json()
 
     def password_policy(self):
-        r = httpx.get(f"{self.base_url}/auth/policy")
+        r = self._http_get(f"{self.base_url}/auth/policy")
         r.raise_for_status()
         return r.json()
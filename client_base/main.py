@@ -16,6 +16,8 @@ from account_store import (
     save_font_scale,
     load_account_password,
     save_account_password,
+    load_refresh_token,
+    save_refresh_token,
 )
 from settings_dialog import SettingsDialog
 
@@ -24,6 +26,7 @@ class PLMClient(MainWindowUI):
         super().__init__()
         self.api = APIClient()
         self._codici_cache = []
+        self._changes_cursor = None
         self._codici_by_code = {}
         self._bom_cache = {}
         self._codes_with_bom = set()
@@ -52,16 +55,59 @@ class PLMClient(MainWindowUI):
 
     def carica_lista(self):
         try:
-            codici = self.api.lista_codici()
-            self._codici_cache = codici
-            self._codici_by_code = {c.get("codice"): c for c in codici}
-            self._preload_bom_presence()
+            if self._changes_cursor is not None and self._codici_cache:
+                self._apply_remote_changes()
+            else:
+                # il cursore va letto prima del download: eventuali modifiche concorrenti verranno riapplicate
+                cursor = self.api.modifiche()["cursor"]
+                codici = self.api.lista_codici()
+                self._codici_cache = codici
+                self._codici_by_code = {c.get("codice"): c for c in codici}
+                self._preload_bom_presence()
+                self._changes_cursor = cursor
             self._apply_filters()
         except Exception as e:
             QMessageBox.critical(self, "Errore", f"Errore di connessione:\n{e}")
 
+    def _apply_remote_changes(self):
+        """Aggiorna la cache locale applicando solo le modifiche registrate dal server"""
+        codici_toccati = set()
+        distinte_toccate = set()
+        while True:
+            pagina = self.api.modifiche(since=self._changes_cursor)
+            for change in pagina.get("changes", []):
+                code = change.get("codice")
+                if not code:
+                    continue
+                if change.get("entita") == "distinta":
+                    distinte_toccate.add(code)
+                elif change.get("entita") in ("codice", "revisione"):
+                    codici_toccati.add(code)
+            self._changes_cursor = pagina.get("cursor", self._changes_cursor)
+            if not pagina.get("has_more"):
+                break
+
+        for code in codici_toccati:
+            codice = self.api.cerca_codice(code)
+            if codice and code in self._codici_by_code:
+                self._codici_by_code[code].update(codice)
+            elif codice:
+                self._codici_cache.append(codice)
+                self._codici_by_code[code] = codice
+                distinte_toccate.add(code)
+            elif code in self._codici_by_code:
+                # non più visibile (es. nessuna revisione rilasciata)
+                self._codici_cache.remove(self._codici_by_code.pop(code))
+
+        for code in distinte_toccate:
+            if code in self._codici_by_code:
+                self._ensure_bom_cached(code, force=True)
+
     def _ensure_account_session(self):
         saved = load_account_context()
+        refresh_token = load_refresh_token()
+        if saved and refresh_token and self._resume_session(refresh_token):
+            return
         saved_password = load_account_password()
         if saved and saved_password:
             if self._attempt_login(saved, saved_password, persist=False, show_errors=False):
@@ -93,6 +139,18 @@ class PLMClient(MainWindowUI):
             if self._attempt_login(selection, password, persist=True, show_errors=True):
                 break
 
+    def _resume_session(self, refresh_token: str) -> bool:
+        """Auto-login tramite refresh token: evita la verifica password (bcrypt) ad ogni avvio"""
+        try:
+            verified = self.api.refresh_session(refresh_token)
+        except Exception:
+            save_refresh_token("")
+            return False
+        self.api.set_account_context(verified)
+        self._account_info = verified
+        save_refresh_token(verified.get("refresh_token") or "")
+        return True
+
     def _attempt_login(self, selection, password: str, *, persist: bool, show_errors: bool) -> bool:
         try:
             verified = self.api.login_account(
@@ -107,6 +165,7 @@ class PLMClient(MainWindowUI):
             return False
         self.api.set_account_context(verified)
         self._account_info = verified
+        save_refresh_token(verified.get("refresh_token") or "")
         if persist:
             save_account_context(verified)
             save_account_password(password)
@@ -162,9 +221,11 @@ class PLMClient(MainWindowUI):
             self._bom_window = None
         self._codici_cache.clear()
         self._codici_by_code.clear()
+        self._changes_cursor = None
         self._bom_cache.clear()
         self._codes_with_bom.clear()
         self._clear_data_rows()
+        self.api.close()
         python = sys.executable
         script = Path(__file__).resolve()
 
@@ -464,4 +525,5 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = PLMClient()
     window.show()
+    app.aboutToQuit.connect(window.api.close)
     sys.exit(app.exec())
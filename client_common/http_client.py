@@ -0,0 +1,70 @@
+import importlib.util
+import os
+import threading
+import time
+
+import httpx
+
+# Connessione al server: un solo httpx.Client (pool keep-alive) per tutta l'applicazione.
+# PLM_HTTP2=1 abilita HTTP/2 se è installato il pacchetto h2 (httpx[http2])
+HTTP_TIMEOUT = float(os.environ.get("PLM_HTTP_TIMEOUT", 10))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("PLM_HTTP_CONNECT_TIMEOUT", 5))
+HTTP2 = os.environ.get("PLM_HTTP2", "0").strip().lower() in {"1", "true", "yes", "on"}
+HTTP_MAX_KEEPALIVE = int(os.environ.get("PLM_HTTP_MAX_KEEPALIVE", 10))
+# nuovi tentativi per le GET (idempotenti) su errori di rete e 502/503/504, solo fuori dal thread
+# dell'interfaccia: lì l'attesa tra un tentativo e l'altro bloccherebbe la finestra
+GET_RETRIES = int(os.environ.get("PLM_HTTP_GET_RETRIES", 3))
+RETRY_BACKOFF_SECONDS = 0.5
+_RETRY_STATUS = {502, 503, 504}
+
+
+class HTTPClientBase:
+    """Client HTTP condiviso dai tre client PLM: pool keep-alive, GET ripetute e cache ETag"""
+
+    def __init__(
+        self,
+        base_url="http://127.0.0.1:8000",
+        timeout=HTTP_TIMEOUT,
+        http2=HTTP2,
+        retries=GET_RETRIES,
+    ):
+        self.base_url = base_url
+        self._etag_cache = {}
+        self._retries = retries
+        self._http = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=HTTP_MAX_KEEPALIVE, keepalive_expiry=30),
+            http2=http2 and importlib.util.find_spec("h2") is not None,
+        )
+
+    def close(self):
+        """Chiude le connessioni del pool (logout e uscita dall'applicazione)"""
+        self._http.close()
+
+    def _http_get(self, url, **kwargs):
+        """GET sul client condiviso; nei thread di lavoro è ripetuta con backoff esponenziale su errori transitori"""
+        retries = 0 if threading.current_thread() is threading.main_thread() else self._retries
+        for tentativo in range(retries + 1):
+            ultimo = tentativo == retries
+            try:
+                r = self._http.get(url, **kwargs)
+            except httpx.TransportError:
+                if ultimo:
+                    raise
+            else:
+                if ultimo or r.status_code not in _RETRY_STATUS:
+                    return r
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** tentativo)
+
+    def _get(self, url, params=None):
+        """GET condizionale: rimanda l'ETag ricevuto e riusa la risposta in cache sul 304"""
+        key = (url, tuple(sorted((params or {}).items())))
+        cached = self._etag_cache.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        r = self._http_get(url, params=params, headers=headers)
+        if r.status_code == 304 and cached:
+            return httpx.Response(200, content=cached[1], request=r.request)
+        etag = r.headers.get("etag")
+        if r.status_code == 200 and etag:
+            self._etag_cache[key] = (etag, r.content)
+        return r
@@ -1,11 +1,11 @@
 import base64
 import json
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 CONFIG_DIR = Path.home() / ".plm_client"
 CONFIG_FILE = CONFIG_DIR / "account.json"
-DEFAULT_CONFIG = {"account": None, "font_scale": 1.0, "credentials": None}
+DEFAULT_CONFIG = {"account": None, "font_scale": 1.0, "credentials": None, "session": None, "open_codes": []}
 
 
 def _read_config() -> Dict:
@@ -34,6 +34,8 @@ def _write_config(config: Dict) -> None:
         "account": config.get("account"),
         "font_scale": config.get("font_scale", DEFAULT_CONFIG["font_scale"]),
         "credentials": config.get("credentials"),
+        "session": config.get("session"),
+        "open_codes": config.get("open_codes") or [],
     }
     with CONFIG_FILE.open("w", encoding="utf-8") as handle:
         json.dump(payload, handle, ensure_ascii=True, indent=2)
@@ -68,6 +70,8 @@ def clear_account_context() -> None:
     config = _read_config()
     config["account"] = None
     config["credentials"] = None
+    config["session"] = None
+    config["open_codes"] = []
     _write_config(config)
 
 
@@ -106,3 +110,28 @@ def load_account_password() -> Optional[str]:
         return base64.b64decode(encoded.encode("ascii")).decode("utf-8")
     except Exception:
         return None
+
+
+def save_refresh_token(token: str) -> None:
+    config = _read_config()
+    config["session"] = {"refresh_token": token} if token else None
+    _write_config(config)
+
+
+def load_refresh_token() -> Optional[str]:
+    config = _read_config()
+    session = config.get("session") or {}
+    return session.get("refresh_token") or None
+
+
+def save_open_codes(codes: List[str]) -> None:
+    config = _read_config()
+    config["open_codes"] = [str(code) for code in codes if code]
+    _write_config(config)
+
+
+def load_open_codes() -> List[str]:
+    codes = _read_config().get("open_codes")
+    if not isinstance(codes, list):
+        return []
+    return [str(code) for code in codes if code]
@@ -1,13 +1,66 @@
+import hashlib
 import httpx
 import mimetypes
+import os
+import sys
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 
+# modulo HTTP condiviso dai tre client (cartella client_common accanto a questa)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from client_common.http_client import HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT, HTTPClientBase  # noqa: E402
 
-class APIClient:
-    def __init__(self, base_url="http://127.0.0.1:8000"):
-        self.base_url = base_url
+# oltre questa dimensione il trascinamento file usa il caricamento a blocchi (/uploads)
+CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_CHUNK_RETRIES = 4
+# attesa massima della risposta a corpo inviato (il server copia il file e ne calcola l'hash):
+# limitata, così un caricamento annullato termina comunque
+UPLOAD_RESPONSE_TIMEOUT = float(os.environ.get("PLM_UPLOAD_RESPONSE_TIMEOUT", 300))
+
+# progress(byte_inviati, byte_totali)
+ProgressCallback = Callable[[int, int], None]
+
+
+class UploadCancelled(Exception):
+    pass
+
+
+class _ProgressReader:
+    """File aperto letto da httpx a blocchi: segnala l'avanzamento e interrompe se annullato"""
+
+    def __init__(self, buffer, progress: Optional[ProgressCallback], cancel_event: Optional[threading.Event]):
+        self._buffer = buffer
+        self._progress = progress
+        self._cancel_event = cancel_event
+        self._total = Path(buffer.name).stat().st_size
+        self._sent = 0
+
+    def read(self, size=-1):
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            raise UploadCancelled("Caricamento annullato")
+        data = self._buffer.read(size)
+        self._sent += len(data)
+        if self._progress and data:
+            self._progress(self._sent, self._total)
+        return data
+
+    def seek(self, offset, whence=0):
+        self._sent = 0
+        return self._buffer.seek(offset, whence)
+
+    def __getattr__(self, name):
+        return getattr(self._buffer, name)
+
+
+class APIClient(HTTPClientBase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self._account_context: Optional[Dict[str, str]] = None
+        # sessioni di caricamento aperte: un nuovo tentativo sullo stesso file riprende da qui
+        self._upload_sessions = {}
 
     def set_account_context(self, context: Optional[Dict[str, str]]):
         if context:
@@ -18,33 +71,54 @@ class APIClient:
     def _auth_headers(self) -> Dict[str, str]:
         if not self._account_context or not self._account_context.get("header"):
             raise RuntimeError("Nessun account selezionato.")
-        return {"X-PLM-Account": self._account_context["header"]}
+        context = self._account_context
+        if context.get("access_token"):
+            # rinnova il token poco prima della scadenza, senza richiedere la password
+            if context.get("refresh_token") and context.get("expires_at", 0) - time.time() < 60:
+                self.set_account_context(self.refresh_session(context["refresh_token"]))
+                context = self._account_context
+            return {"Authorization": f"Bearer {context['access_token']}"}
+        return {"X-PLM-Account": context["header"]}
 
     def lista_codici(self, include_unreleased=True):
         """Ottiene tutti i codici visibili al client tecnico"""
         params = {"include_unreleased": str(include_unreleased).lower()} if include_unreleased else {}
-        r = httpx.get(f"{self.base_url}/codici/", params=params or None)
+        r = self._get(f"{self.base_url}/codici/", params=params or None)
         r.raise_for_status()
         return r.json()
 
     def cerca_codice(self, codice, include_unreleased=True):
         """Cerca un singolo codice"""
         params = {"include_unreleased": str(include_unreleased).lower()} if include_unreleased else None
-        r = httpx.get(f"{self.base_url}/codici/{codice}", params=params)
+        r = self._http_get(f"{self.base_url}/codici/{codice}", params=params)
         if r.status_code == 404:
             return None
         r.raise_for_status()
         return r.json()
 
+    def ricerca_codici(self, testo, limit=20, include_unreleased=True):
+        """Ricerca full-text lato server su codice, descrizione e ubicazione"""
+        params = {"q": testo, "limit": limit, "include_unreleased": str(include_unreleased).lower()}
+        r = self._http_get(f"{self.base_url}/codici/search", params=params)
+        r.raise_for_status()
+        return r.json()
+
     def dettaglio_codice(self, codice, include_unreleased=True):
         """Restituisce codice, descrizione, revisioni e file"""
         params = {"include_unreleased": str(include_unreleased).lower()} if include_unreleased else None
-        r = httpx.get(f"{self.base_url}/codici/{codice}/dettaglio", params=params)
+        r = self._get(f"{self.base_url}/codici/{codice}/dettaglio", params=params)
         if r.status_code == 404:
             return None
         r.raise_for_status()
         return r.json()
 
+    def dettagli_codici(self, codici, include_unreleased=True):
+        """Dettagli di più codici in una sola richiesta: {"dettagli": [...], "mancanti": [...]}"""
+        payload = {"codici": list(codici), "include_unreleased": bool(include_unreleased)}
+        r = self._http.post(f"{self.base_url}/codici/dettagli", json=payload)
+        r.raise_for_status()
+        return r.json()
+
     def crea_codice(self, codice, descrizione, quantita, ubicazione, stato=None):
         """Crea un nuovo codice nel database PLM"""
         payload = {
@@ -56,24 +130,24 @@ class APIClient:
         }
         if stato:
             payload["stato"] = stato
-        r = httpx.post(f"{self.base_url}/codici/", json=payload, headers=self._auth_headers())
+        r = self._http.post(f"{self.base_url}/codici/", json=payload, headers=self._auth_headers())
         r.raise_for_status()
         return r.json()
 
     def lista_stati(self):
         """Recupera gli stati configurati lato server"""
-        r = httpx.get(f"{self.base_url}/stati/")
+        r = self._http_get(f"{self.base_url}/stati/")
         r.raise_for_status()
         return r.json()
 
     def lista_campi_form(self):
         """Recupera la lista di campi del form certificazione"""
-        r = httpx.get(f"{self.base_url}/form/campi")
+        r = self._http_get(f"{self.base_url}/form/campi")
         r.raise_for_status()
         return r.json()
 
     def rilascia_revisione(self, codice, indice):
-        r = httpx.post(
+        r = self._http.post(
             f"{self.base_url}/revisioni/{codice}/{indice}/rilascio",
             headers=self._auth_headers(),
         )
@@ -86,13 +160,13 @@ class APIClient:
             payload["stato"] = stato
         if cad_file:
             payload["cad_file"] = cad_file
-        r = httpx.post(f"{self.base_url}/revisioni/", json=payload, headers=self._auth_headers())
+        r = self._http.post(f"{self.base_url}/revisioni/", json=payload, headers=self._auth_headers())
         r.raise_for_status()
         return r.json()
 
     def cambia_stato_revisione(self, codice, indice, nuovo_stato):
         payload = {"stato": nuovo_stato}
-        r = httpx.post(
+        r = self._http.post(
             f"{self.base_url}/revisioni/{codice}/{indice}/stato",
             json=payload,
             headers=self._auth_headers(),
@@ -101,13 +175,13 @@ class APIClient:
         return r.json()
 
     def get_certificazione(self, codice, indice):
-        r = httpx.get(f"{self.base_url}/revisioni/{codice}/{indice}/certificazione")
+        r = self._http_get(f"{self.base_url}/revisioni/{codice}/{indice}/certificazione")
         r.raise_for_status()
         return r.json()
 
     def salva_certificazione(self, codice, indice, campi):
         payload = {"campi": campi}
-        r = httpx.post(
+        r = self._http.post(
             f"{self.base_url}/revisioni/{codice}/{indice}/certificazione",
             json=payload,
             headers=self._auth_headers(),
@@ -116,27 +190,116 @@ class APIClient:
         return r.json()
 
     def lista_file_revisione(self, codice, indice):
-        r = httpx.get(f"{self.base_url}/revisioni/{codice}/{indice}/files")
+        r = self._http_get(f"{self.base_url}/revisioni/{codice}/{indice}/files")
         r.raise_for_status()
         return r.json()
 
-    def carica_file_revisione(self, codice, indice, filepath):
+    def carica_file_revisione(
+        self,
+        codice,
+        indice,
+        filepath,
+        progress: Optional[ProgressCallback] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        """Invio multipart in streaming dal file aperto: la memoria usata non dipende dalla dimensione del file"""
         path = Path(filepath)
         if not path.is_file():
             raise FileNotFoundError(path)
         mime, _ = mimetypes.guess_type(str(path))
         with path.open("rb") as buffer:
-            files = [("files", (path.name, buffer.read(), mime or "application/octet-stream"))]
-            r = httpx.post(
+            reader = _ProgressReader(buffer, progress, cancel_event)
+            files = [("files", (path.name, reader, mime or "application/octet-stream"))]
+            r = self._http.post(
                 f"{self.base_url}/revisioni/{codice}/{indice}/files",
                 files=files,
                 headers=self._auth_headers(),
+                timeout=_upload_timeout(),
             )
         r.raise_for_status()
         return r.json()
 
+    def carica_file_revisione_a_blocchi(
+        self,
+        codice,
+        indice,
+        filepath,
+        chunk_size=UPLOAD_CHUNK_SIZE,
+        progress: Optional[ProgressCallback] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        """Caricamento a blocchi con checksum: se interrotto, la chiamata successiva invia solo i blocchi mancanti"""
+        path = Path(filepath)
+        if not path.is_file():
+            raise FileNotFoundError(path)
+        stat = path.stat()
+        key = (codice, indice, str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+        stato = None
+        upload_id = self._upload_sessions.get(key)
+        if upload_id:
+            r = self._http_get(f"{self.base_url}/uploads/{upload_id}", headers=self._auth_headers())
+            if r.status_code != 404:
+                r.raise_for_status()
+                stato = r.json()
+        if stato is None:
+            mime, _ = mimetypes.guess_type(str(path))
+            payload = {
+                "codice": codice,
+                "indice": indice,
+                "filename": path.name,
+                "size": stat.st_size,
+                "mimetype": mime or "application/octet-stream",
+                "chunk_size": chunk_size,
+                "sha256": _file_sha256(path),
+            }
+            r = self._http.post(f"{self.base_url}/uploads", json=payload, headers=self._auth_headers())
+            r.raise_for_status()
+            stato = r.json()
+            self._upload_sessions[key] = stato["id"]
+        upload_id = stato["id"]
+
+        inviati = stat.st_size - sum(
+            min(stato["chunk_size"], stat.st_size - numero * stato["chunk_size"]) for numero in stato["missing"]
+        )
+        with path.open("rb") as buffer:
+            for numero in stato["missing"]:
+                # la sessione resta aperta: un nuovo tentativo riprende dai blocchi mancanti
+                if cancel_event is not None and cancel_event.is_set():
+                    raise UploadCancelled("Caricamento annullato")
+                buffer.seek(numero * stato["chunk_size"])
+                data = buffer.read(stato["chunk_size"])
+                self._put_chunk(upload_id, numero, data)
+                inviati += len(data)
+                if progress:
+                    progress(inviati, stat.st_size)
+        r = self._http.post(
+            f"{self.base_url}/uploads/{upload_id}/commit", headers=self._auth_headers(), timeout=_upload_timeout()
+        )
+        r.raise_for_status()
+        self._upload_sessions.pop(key, None)
+        return r.json()
+
+    def _put_chunk(self, upload_id, numero, data):
+        headers = {**self._auth_headers(), "X-Chunk-SHA256": hashlib.sha256(data).hexdigest()}
+        for tentativo in range(UPLOAD_CHUNK_RETRIES):
+            try:
+                r = self._http.put(
+                    f"{self.base_url}/uploads/{upload_id}/chunks/{numero}",
+                    content=data,
+                    headers=headers,
+                    timeout=60,
+                )
+                if r.status_code < 500:
+                    r.raise_for_status()
+                    return
+            except httpx.TransportError:
+                if tentativo == UPLOAD_CHUNK_RETRIES - 1:
+                    raise
+            time.sleep(2 ** tentativo)
+        r.raise_for_status()
+
     def lista_account_hierarchy(self):
-        r = httpx.get(f"{self.base_url}/auth/accounts")
+        r = self._http_get(f"{self.base_url}/auth/accounts")
         r.raise_for_status()
         return r.json()
 
@@ -147,17 +310,35 @@ class APIClient:
             "account": account,
             "password": password,
         }
-        r = httpx.post(f"{self.base_url}/auth/login", json=payload)
+        r = self._http.post(f"{self.base_url}/auth/login", json=payload)
+        r.raise_for_status()
+        return r.json()
+
+    def refresh_session(self, refresh_token: str):
+        """Nuovi token di sessione a partire dal refresh token salvato (nessuna password)"""
+        r = self._http.post(f"{self.base_url}/auth/refresh", json={"refresh_token": refresh_token})
         r.raise_for_status()
         return r.json()
 
     def crea_account_login(self, account: str, password: str):
         payload = {"account": account, "password": password}
-        r = httpx.post(f"{self.base_url}/auth/accounts", json=payload)
+        r = self._http.post(f"{self.base_url}/auth/accounts", json=payload)
         r.raise_for_status()
         return r.json()
 
     def password_policy(self):
-        r = httpx.get(f"{self.base_url}/auth/policy")
+        r = self._http_get(f"{self.base_url}/auth/policy")
         r.raise_for_status()
         return r.json()
+
+
+def _upload_timeout() -> httpx.Timeout:
+    return httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, read=UPLOAD_RESPONSE_TIMEOUT)
+
+
+def _file_sha256(path: Path, block_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with path.open("rb") as buffer:
+        while data := buffer.read(block_size):
+            hasher.update(data)
+    return hasher.hexdigest()
@@ -1,5 +1,6 @@
 import os
 import sys
+import threading
 from pathlib import Path
 from PySide6.QtWidgets import (
     QApplication,
@@ -12,15 +13,16 @@ from PySide6.QtWidgets import (
     QVBoxLayout,
     QWidget,
     QTableWidgetItem,
+    QListWidgetItem,
     QPushButton,
     QCompleter,
     QDialog,
 )
-from PySide6.QtCore import Qt, QStringListModel, QTimer
-from PySide6.QtGui import QFont
+from PySide6.QtCore import Qt, QObject, QStringListModel, QThread, QTimer, Signal, Slot
+from PySide6.QtGui import QFont, QKeySequence, QShortcut
 
 from ui_mainwindow import UffTecMainWindowUI
-from api_client import APIClient
+from api_client import APIClient, CHUNKED_UPLOAD_THRESHOLD, UploadCancelled
 from account_dialog import AccountSelectionDialog
 from account_store import (
     load_account_context,
@@ -30,10 +32,81 @@ from account_store import (
     save_font_scale,
     load_account_password,
     save_account_password,
+    load_refresh_token,
+    save_refresh_token,
+    load_open_codes,
+    save_open_codes,
 )
 from settings_dialog import SettingsDialog
 
 
+# thread di caricamento ancora in attesa del server quando la finestra si chiude: restano vivi
+# (le richieste hanno timeout limitati) e l'uscita li attende invece di distruggerli
+_detached_upload_threads = []
+
+
+def _wait_detached_uploads():
+    for thread in list(_detached_upload_threads):
+        try:
+            thread.wait()
+        except RuntimeError:
+            # già terminato ed eliminato da deleteLater
+            pass
+
+
+class FileUploadWorker(QObject):
+    """Carica i file trascinati in un QThread: la finestra resta reattiva e riceve l'avanzamento via segnali"""
+
+    # nome file, percentuale (la percentuale evita int oltre i 2 GB nei segnali Qt)
+    progress = Signal(str, int)
+    # file caricati, errori, annullato
+    finished = Signal(int, list, bool)
+
+    def __init__(self, api, codice, indice, paths):
+        super().__init__()
+        self._api = api
+        self._codice = codice
+        self._indice = indice
+        self._paths = paths
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @Slot()
+    def run(self):
+        uploaded = 0
+        errors = []
+        for path in self._paths:
+            if self._cancel_event.is_set():
+                break
+            last_percent = -1
+
+            def _report(sent, total, name=path.name):
+                nonlocal last_percent
+                percent = int(sent * 100 / total) if total else 100
+                if percent != last_percent:
+                    last_percent = percent
+                    self.progress.emit(name, percent)
+
+            self.progress.emit(path.name, 0)
+            try:
+                if path.stat().st_size > CHUNKED_UPLOAD_THRESHOLD:
+                    self._api.carica_file_revisione_a_blocchi(
+                        self._codice, self._indice, path, progress=_report, cancel_event=self._cancel_event
+                    )
+                else:
+                    self._api.carica_file_revisione(
+                        self._codice, self._indice, path, progress=_report, cancel_event=self._cancel_event
+                    )
+                uploaded += 1
+            except UploadCancelled:
+                break
+            except Exception as exc:
+                errors.append(f"{path.name}: {exc}")
+        self.finished.emit(uploaded, errors, self._cancel_event.is_set())
+
+
 class UffTecClient(UffTecMainWindowUI):
     def __init__(self):
         super().__init__()
@@ -45,13 +118,18 @@ class UffTecClient(UffTecMainWindowUI):
         self._current_form_revision = None
         self._current_form_editable = False
         self._pending_revision_index = None
-        self._all_codes = []
         self._current_files = []
+        self._upload_thread = None
+        self._upload_worker = None
         self._code_model = QStringListModel(self)
         self._code_completer = QCompleter(self._code_model, self)
         self._code_completer.setCaseSensitivity(Qt.CaseInsensitive)
-        self._code_completer.setFilterMode(Qt.MatchFlag.MatchContains)
-        self._code_completer.setCompletionMode(QCompleter.CompletionMode.PopupCompletion)
+        # i suggerimenti arrivano già filtrati e ordinati dalla ricerca lato server
+        self._code_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(200)
+        self._search_timer.timeout.connect(self._refresh_code_suggestions)
         self.search_input.setCompleter(self._code_completer)
         self.search_input.textEdited.connect(self._handle_search_text_edited)
         self._code_completer.activated.connect(self._handle_completer_selected)
@@ -70,8 +148,8 @@ class UffTecClient(UffTecMainWindowUI):
 
         self._load_states()
         self._load_form_fields()
-        self._load_codes_list()
         self._set_empty_detail()
+        self._restore_workspace()
 
         self.search_input.returnPressed.connect(self._handle_search)
         self.btn_new_code.clicked.connect(self.nuovo_codice)
@@ -83,8 +161,10 @@ class UffTecClient(UffTecMainWindowUI):
         self.btn_save_form.clicked.connect(self._save_form_certificazione)
         self.form_table.itemChanged.connect(self._on_form_item_changed)
         self.files_list.filesDropped.connect(self._handle_files_dropped)
+        self.btn_cancel_upload.clicked.connect(self._cancel_upload)
         self.side_nav.currentRowChanged.connect(self._handle_side_nav_selection)
         self.btn_settings.clicked.connect(self._open_settings)
+        QShortcut(QKeySequence(QKeySequence.StandardKey.Refresh), self, activated=self._refresh_open_codes)
 
     def _load_states(self):
         try:
@@ -102,17 +182,24 @@ class UffTecClient(UffTecMainWindowUI):
                 {"name": "ubicazione", "label": "Ubicazione"},
             ]
 
-    def _load_codes_list(self):
+    def _refresh_code_suggestions(self):
+        testo = self.search_input.text().strip()
+        if not testo:
+            return
         try:
-            codici = self.api.lista_codici(include_unreleased=True)
+            risultati = self.api.ricerca_codici(testo, limit=50)
         except Exception:
-            codici = []
-        codes = sorted({c.get("codice") for c in codici if c.get("codice")})
-        self._all_codes = codes
-        self._code_model.setStringList(self._all_codes)
+            return
+        codes = [c.get("codice") for c in risultati if c.get("codice")]
+        self._code_model.setStringList(codes)
+        if codes and self.search_input.hasFocus():
+            self._code_completer.complete()
 
     def _ensure_account_session(self):
         saved = load_account_context()
+        refresh_token = load_refresh_token()
+        if saved and refresh_token and self._resume_session(refresh_token):
+            return
         saved_password = load_account_password()
         if saved and saved_password:
             if self._attempt_login(saved, saved_password, persist=False, show_errors=False):
@@ -157,6 +244,19 @@ class UffTecClient(UffTecMainWindowUI):
             if self._attempt_login(selection, password, persist=True, show_errors=True):
                 break
 
+    def _resume_session(self, refresh_token: str) -> bool:
+        """Auto-login tramite refresh token: evita la verifica password (bcrypt) ad ogni avvio"""
+        try:
+            verified = self.api.refresh_session(refresh_token)
+        except Exception:
+            save_refresh_token("")
+            return False
+        self.api.set_account_context(verified)
+        self._account_info = verified
+        save_refresh_token(verified.get("refresh_token") or "")
+        self._update_home_tab_label()
+        return True
+
     def _attempt_login(self, selection, password: str, *, persist: bool, show_errors: bool) -> bool:
         try:
             verified = self.api.login_account(
@@ -175,6 +275,7 @@ class UffTecClient(UffTecMainWindowUI):
             return False
         self.api.set_account_context(verified)
         self._account_info = verified
+        save_refresh_token(verified.get("refresh_token") or "")
         if persist:
             save_account_context(verified)
             save_account_password(password)
@@ -230,6 +331,8 @@ class UffTecClient(UffTecMainWindowUI):
         self.tabs_list.clear()
         self._current_detail = None
         self._set_empty_detail()
+        self._stop_upload()
+        self.api.close()
         python = sys.executable
         script = Path(__file__).resolve()
 
@@ -251,14 +354,6 @@ class UffTecClient(UffTecMainWindowUI):
             text = base
         item.setText(text)
 
-    def _add_code_to_completer(self, codice):
-        if not codice:
-            return
-        if codice not in self._all_codes:
-            self._all_codes.append(codice)
-            self._all_codes.sort()
-            self._code_model.setStringList(self._all_codes)
-
     def _handle_completer_selected(self, text):
         if not text:
             return
@@ -266,9 +361,10 @@ class UffTecClient(UffTecMainWindowUI):
         self._handle_search()
 
     def _handle_search_text_edited(self, text):
-        self._code_completer.setCompletionPrefix(text)
-        if text:
-            self._code_completer.complete()
+        if text.strip():
+            self._search_timer.start()
+        else:
+            self._search_timer.stop()
 
     def _handle_search(self):
         codice = self.search_input.text().strip()
@@ -278,7 +374,6 @@ class UffTecClient(UffTecMainWindowUI):
         detail = self._fetch_detail(codice)
         if detail:
             self._add_or_focus_code(detail)
-            self._add_code_to_completer(detail.get("codice"))
 
     def _fetch_detail(self, codice):
         try:
@@ -305,6 +400,40 @@ class UffTecClient(UffTecMainWindowUI):
         self._update_code_tree_item(item, codice_data, expand=False)
         self.tabs_list.setCurrentItem(item)
 
+    def _restore_workspace(self):
+        codici = load_open_codes()
+        if codici:
+            self._refresh_open_codes(codici, show_errors=False)
+            self.tabs_list.setCurrentItem(None)
+
+    def _refresh_open_codes(self, codici=None, show_errors=True):
+        """Aggiorna (o riapre) i codici dell'albero con un'unica richiesta /codici/dettagli"""
+        codici = list(codici if codici is not None else self._open_codes)
+        if not codici:
+            return
+        try:
+            risposta = self.api.dettagli_codici(codici)
+        except Exception as exc:
+            if show_errors:
+                QMessageBox.critical(self, "Errore di connessione", str(exc))
+            return
+        for dettaglio in risposta.get("dettagli", []):
+            codice = dettaglio.get("codice")
+            item = self._open_codes.get(codice)
+            if not item:
+                item = QTreeWidgetItem([codice])
+                self.tabs_list.addTopLevelItem(item)
+                self._open_codes[codice] = item
+            self._update_code_tree_item(item, dettaglio, expand=item.isExpanded())
+        # codici eliminati o non più visibili: fuori dall'albero
+        for codice in risposta.get("mancanti", []):
+            item = self._open_codes.pop(codice, None)
+            if item:
+                self.tabs_list.takeTopLevelItem(self.tabs_list.indexOfTopLevelItem(item))
+        current = self.tabs_list.currentItem()
+        if current and current.parent() is None:
+            self._handle_tree_selection_changed(current, None)
+
     def _update_code_tree_item(self, item: QTreeWidgetItem, dettaglio, expand: bool = False):
         codice = dettaglio.get("codice", "Codice")
         item.setText(0, codice)
@@ -493,7 +622,6 @@ class UffTecClient(UffTecMainWindowUI):
             if dettaglio:
                 self.search_input.setText(codice_generato)
                 self._add_or_focus_code(dettaglio)
-                self._add_code_to_completer(codice_generato)
         self.search_input.setFocus()
 
     def _update_release_button(self, revisioni):
@@ -678,19 +806,46 @@ class UffTecClient(UffTecMainWindowUI):
         indice = self._current_form_revision.get("indice")
         if not codice or indice is None:
             return
-        uploaded = 0
-        errors = []
-        for raw_path in paths:
-            path = Path(raw_path)
-            if not path.is_file():
-                continue
-            try:
-                self.api.carica_file_revisione(codice, indice, path)
-                uploaded += 1
-            except Exception as exc:
-                errors.append(f"{path.name}: {exc}")
+        if self._upload_thread is not None:
+            QMessageBox.information(self, "Caricamento in corso", "Attendi la fine del caricamento in corso.")
+            return
+        files = [path for path in map(Path, paths) if path.is_file()]
+        if not files:
+            return
+        self._upload_worker = FileUploadWorker(self.api, codice, indice, files)
+        self._upload_thread = QThread(self)
+        self._upload_worker.moveToThread(self._upload_thread)
+        self._upload_thread.started.connect(self._upload_worker.run)
+        self._upload_worker.progress.connect(self._on_upload_progress)
+        self._upload_worker.finished.connect(self._on_upload_finished)
+        self._upload_worker.finished.connect(self._upload_thread.quit)
+        self._upload_thread.finished.connect(self._upload_worker.deleteLater)
+        self._upload_thread.finished.connect(self._upload_thread.deleteLater)
+        self.files_list.setDropsEnabled(False)
+        self.upload_progress.setValue(0)
+        self.btn_cancel_upload.setEnabled(True)
+        self.upload_bar.setVisible(True)
+        self._upload_thread.start()
+
+    def _on_upload_progress(self, filename, percent):
+        self.upload_progress.setFormat(f"{filename}: %p%")
+        self.upload_progress.setValue(percent)
+
+    def _cancel_upload(self):
+        if self._upload_worker is not None:
+            self.btn_cancel_upload.setEnabled(False)
+            self._upload_worker.cancel()
+
+    def _on_upload_finished(self, uploaded, errors, cancelled):
+        self._upload_thread = None
+        self._upload_worker = None
+        self.upload_bar.setVisible(False)
+        self.files_list.setDropsEnabled(self._current_form_editable)
         if uploaded:
             self._refresh_file_list(show_errors=True)
+        if cancelled:
+            QMessageBox.information(self, "Caricamento annullato", f"Caricati {uploaded} file prima dell'annullamento.")
+        elif uploaded:
             QMessageBox.information(self, "Caricamento completato", f"Caricati {uploaded} file.")
         if errors:
             QMessageBox.warning(self, "Alcuni file non caricati", "\n".join(errors[:5]))
@@ -858,6 +1013,23 @@ class UffTecClient(UffTecMainWindowUI):
         if reset_nav:
             self._clear_side_nav_selection()
 
+    def _stop_upload(self):
+        thread = self._upload_thread
+        if thread is None:
+            return
+        self._upload_worker.cancel()
+        thread.quit()
+        if not thread.wait(5000):
+            # la richiesta in corso non si interrompe: il thread non deve essere distrutto con la finestra
+            thread.setParent(None)
+            _detached_upload_threads.append(thread)
+
+    def closeEvent(self, event):
+        if self._account_info:
+            save_open_codes(list(self._open_codes))
+        self._stop_upload()
+        super().closeEvent(event)
+
     def _clear_side_nav_selection(self):
         nav = getattr(self, "side_nav", None)
         if not nav:
@@ -873,4 +1045,7 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = UffTecClient()
     window.showMaximized()
-    sys.exit(app.exec())
+    app.aboutToQuit.connect(window.api.close)
+    exit_code = app.exec()
+    _wait_detached_uploads()
+    sys.exit(exit_code)
@@ -15,6 +15,7 @@ from PySide6.QtWidgets import (
     QTableWidget,
     QTableWidgetItem,
     QStackedWidget,
+    QProgressBar,
 )
 from PySide6.QtGui import QIcon, QPixmap, QPainter, QColor, QPen
 from PySide6.QtCore import Qt, QSize, Signal
@@ -228,6 +229,21 @@ class UffTecMainWindowUI(QMainWindow):
         self.files_list.setEnabled(False)
         right_layout.addWidget(self.files_list, 1)
 
+        self.upload_bar = QWidget()
+        self.upload_bar.setObjectName("uploadBar")
+        upload_layout = QHBoxLayout(self.upload_bar)
+        upload_layout.setContentsMargins(0, 0, 0, 0)
+        upload_layout.setSpacing(8)
+        self.upload_progress = QProgressBar()
+        self.upload_progress.setObjectName("uploadProgress")
+        self.upload_progress.setTextVisible(True)
+        upload_layout.addWidget(self.upload_progress, 1)
+        self.btn_cancel_upload = QPushButton("Annulla")
+        self.btn_cancel_upload.setObjectName("btnCancelUpload")
+        upload_layout.addWidget(self.btn_cancel_upload)
+        self.upload_bar.setVisible(False)
+        right_layout.addWidget(self.upload_bar)
+
         main_layout.addWidget(right_panel)
 
         root_layout.addWidget(main_area, 1)
@@ -1,14 +1,32 @@
 import csv
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from . import models
+from .change_tracking import bump_counter, read_counter
+from .config_registry import CHECK_INTERVAL_SECONDS
+from .database import ReadSessionLocal, SessionLocal
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 ACCOUNTS_FILE = BASE_DIR / "accounts.csv"
 DEFAULT_STABILIMENTO = "da assegnare"
 DEFAULT_GRUPPO = "da assegnare"
+ACCOUNTS_COUNTER = "accounts"
+
+
+class AccountIndex(NamedTuple):
+    version: int
+    by_key: Mapping[Tuple[str, str, str], Dict[str, str]]
+    by_account: Mapping[str, Tuple[Dict[str, str], ...]]
+    hierarchy: Tuple[Dict[str, object], ...]
 
 
-def _read_accounts() -> List[Dict[str, str]]:
+def _read_csv_rows() -> List[Dict[str, str]]:
     if not ACCOUNTS_FILE.exists():
         return []
     with ACCOUNTS_FILE.open("r", encoding="utf-8", newline="") as handle:
@@ -30,9 +48,9 @@ def _read_accounts() -> List[Dict[str, str]]:
         return rows
 
 
-def account_hierarchy() -> List[Dict[str, object]]:
+def _build_hierarchy(rows: List[Dict[str, str]]) -> List[Dict[str, object]]:
     hierarchy: Dict[str, Dict[str, List[str]]] = {}
-    for row in _read_accounts():
+    for row in rows:
         stabilimento = row["stabilimento"]
         gruppo = row["gruppo"]
         account = row["account"]
@@ -55,6 +73,65 @@ def account_hierarchy() -> List[Dict[str, object]]:
     return result
 
 
+def _load_index(db: Session, version: int) -> AccountIndex:
+    accounts = (
+        db.query(models.Account)
+        .options(joinedload(models.Account.gruppo).joinedload(models.Gruppo.stabilimento))
+        .order_by(models.Account.id)
+        .all()
+    )
+    rows = [
+        {
+            "stabilimento": acc.gruppo.stabilimento.nome,
+            "gruppo": acc.gruppo.nome,
+            "account": acc.nome,
+        }
+        for acc in accounts
+    ]
+    by_key: Dict[Tuple[str, str, str], Dict[str, str]] = {}
+    by_account: Dict[str, List[Dict[str, str]]] = {}
+    for row in rows:
+        key = (row["stabilimento"].lower(), row["gruppo"].lower(), row["account"].lower())
+        by_key.setdefault(key, row)
+        by_account.setdefault(row["account"].lower(), []).append(row)
+    return AccountIndex(
+        version=version,
+        by_key=by_key,
+        by_account={name: tuple(matches) for name, matches in by_account.items()},
+        hierarchy=tuple(_build_hierarchy(rows)),
+    )
+
+
+_index: Optional[AccountIndex] = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _current_index(force: bool = False) -> AccountIndex:
+    """
+    Indice in memoria dell'anagrafica. Ogni pochi secondi confronta il contatore di versione
+    nel DB (aggiornato da create_account su qualunque worker) e si ricostruisce solo se è cambiato.
+    """
+    global _index, _checked_at
+    if not force and _index is not None and time.monotonic() - _checked_at < CHECK_INTERVAL_SECONDS:
+        return _index
+    with _index_lock:
+        with ReadSessionLocal() as db:
+            version = read_counter(db, ACCOUNTS_COUNTER)
+            if force or _index is None or _index.version != version:
+                _index = _load_index(db, version)
+        _checked_at = time.monotonic()
+        return _index
+
+
+def accounts_version() -> int:
+    return _current_index().version
+
+
+def account_hierarchy() -> List[Dict[str, object]]:
+    return list(_current_index().hierarchy)
+
+
 def find_account(account: str, stabilimento: Optional[str] = None, gruppo: Optional[str] = None) -> Optional[Dict[str, str]]:
     account_lower = (account or "").strip().lower()
     stabilimento_lower = (stabilimento or "").strip().lower() or None
@@ -62,14 +139,17 @@ def find_account(account: str, stabilimento: Optional[str] = None, gruppo: Optio
     if not account_lower:
         return None
 
-    for row in _read_accounts():
-        if row["account"].lower() != account_lower:
-            continue
+    index = _current_index()
+    if stabilimento_lower and gruppo_lower:
+        row = index.by_key.get((stabilimento_lower, gruppo_lower, account_lower))
+        return dict(row) if row else None
+
+    for row in index.by_account.get(account_lower, ()):
         if stabilimento_lower and row["stabilimento"].lower() != stabilimento_lower:
             continue
         if gruppo_lower and row["gruppo"].lower() != gruppo_lower:
             continue
-        return row
+        return dict(row)
     return None
 
 
@@ -86,27 +166,67 @@ def parse_account_header(raw_value: str) -> Optional[Dict[str, str]]:
     return find_account(account, stabilimento, gruppo)
 
 
-def _ensure_accounts_file():
-    if ACCOUNTS_FILE.exists():
-        return
-    ACCOUNTS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with ACCOUNTS_FILE.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["stabilimento", "gruppo", "account"])
+def _get_or_create_gruppo(db: Session, stabilimento: str, gruppo: str) -> models.Gruppo:
+    stab = db.query(models.Stabilimento).filter(models.Stabilimento.nome == stabilimento).first()
+    if not stab:
+        stab = models.Stabilimento(nome=stabilimento)
+        db.add(stab)
+        db.flush()
+    grp = (
+        db.query(models.Gruppo)
+        .filter(models.Gruppo.stabilimento_id == stab.id, models.Gruppo.nome == gruppo)
+        .first()
+    )
+    if not grp:
+        grp = models.Gruppo(stabilimento_id=stab.id, nome=gruppo)
+        db.add(grp)
+        db.flush()
+    return grp
 
 
-def create_account(account: str) -> Dict[str, str]:
+def import_accounts_csv() -> int:
+    """Importazione una tantum di accounts.csv nelle tabelle, solo se l'anagrafica è vuota."""
+    with SessionLocal() as db:
+        if db.query(models.Account.id).first():
+            return 0
+        imported = 0
+        seen = set()
+        for row in _read_csv_rows():
+            if row["account"].lower() in seen:
+                continue
+            seen.add(row["account"].lower())
+            grp = _get_or_create_gruppo(db, row["stabilimento"], row["gruppo"])
+            db.add(models.Account(gruppo_id=grp.id, nome=row["account"]))
+            imported += 1
+        if imported:
+            bump_counter(db.connection(), ACCOUNTS_COUNTER)
+        db.commit()
+    _current_index(force=True)
+    return imported
+
+
+def create_account(db: Session, account: str) -> Dict[str, str]:
+    """Aggiunge l'account nella transazione di `db`; il commit spetta al chiamante."""
     normalized = (account or "").strip()
     if not normalized:
         raise ValueError("Nome account obbligatorio")
-    if find_account(normalized):
+    if db.query(models.Account.id).filter(models.Account.nome == normalized).first():
         raise ValueError("Account già esistente")
-    _ensure_accounts_file()
-    with ACCOUNTS_FILE.open("a", encoding="utf-8", newline="") as handle:
-        writer = csv.writer(handle)
-        writer.writerow([DEFAULT_STABILIMENTO, DEFAULT_GRUPPO, normalized])
+    try:
+        grp = _get_or_create_gruppo(db, DEFAULT_STABILIMENTO, DEFAULT_GRUPPO)
+        db.add(models.Account(gruppo_id=grp.id, nome=normalized))
+        db.flush()
+    except IntegrityError:
+        # un'altra richiesta (anche su un altro worker) ha inserito lo stesso account
+        db.rollback()
+        raise ValueError("Account già esistente")
+    bump_counter(db.connection(), ACCOUNTS_COUNTER)
     return {
         "stabilimento": DEFAULT_STABILIMENTO,
         "gruppo": DEFAULT_GRUPPO,
         "account": normalized,
     }
+
+
+def invalidate_account_cache() -> None:
+    _current_index(force=True)
@@ -1,7 +1,199 @@
-from typing import Optional
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 
 from . import models, database
 
+logger = logging.getLogger(__name__)
+
+# scrittura differita: le richieste accodano, un thread scrive a blocchi in un'unica transazione
+BATCH_SIZE = int(os.environ.get("PLM_ACTIVITY_BATCH_SIZE", 200))
+FLUSH_INTERVAL_SECONDS = float(os.environ.get("PLM_ACTIVITY_FLUSH_INTERVAL", 1.0))
+MAX_BUFFERED = int(os.environ.get("PLM_ACTIVITY_MAX_BUFFERED", 10000))
+# attesa massima tra due tentativi quando il database non è disponibile
+MAX_RETRY_DELAY_SECONDS = float(os.environ.get("PLM_ACTIVITY_MAX_RETRY_DELAY", 30))
+# PLM_ACTIVITY_SYNC=1 ripristina la scrittura sincrona (una transazione per voce)
+SYNC_MODE = os.environ.get("PLM_ACTIVITY_SYNC", "").strip().lower() in {"1", "true", "yes", "on"}
+
+_queue: "queue.Queue[Dict[str, object]]" = queue.Queue(maxsize=MAX_BUFFERED)
+# voci in attesa di un nuovo tentativo: blocchi non scritti e voci arrivate a coda piena.
+# Il writer le scrive prima della coda; le richieste non attendono mai
+_pending: "deque[Dict[str, object]]" = deque()
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+_stop = threading.Event()
+# il thread di scrittura usa l'unica connessione di scrittura (database.engine) e si mette in coda
+# come le richieste. Solo PLM_ACTIVITY_SYNC apre una connessione propria: la voce viene scritta
+# mentre la richiesta può ancora tenere la connessione principale (attenderebbe se stessa)
+_sync_engine = None
+
+
+def _rollup_counts(connection, entries: List[Dict[str, object]]) -> None:
+    counts = Counter(
+        (
+            entry["created_at"].strftime("%Y-%m-%d"),
+            entry["stabilimento"],
+            entry["gruppo"],
+            entry["account"],
+            entry["azione"],
+        )
+        for entry in entries
+    )
+    table = models.AttivitaGiornaliera.__table__
+    for (giorno, stabilimento, gruppo, account, azione), conteggio in counts.items():
+        stmt = sqlite_insert(table).values(
+            giorno=giorno,
+            stabilimento=stabilimento,
+            gruppo=gruppo,
+            account=account,
+            azione=azione,
+            conteggio=conteggio,
+        )
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["giorno", "stabilimento", "gruppo", "account", "azione"],
+                set_={"conteggio": table.c.conteggio + conteggio},
+            )
+        )
+
+
+def _get_sync_engine():
+    global _sync_engine
+    with _writer_lock:
+        if _sync_engine is None:
+            _sync_engine = database.make_engine(pool_size=1, max_overflow=0)
+    return _sync_engine
+
+
+def _write_batch(entries: List[Dict[str, object]], target_engine=None) -> None:
+    with (target_engine or database.engine).begin() as connection:
+        connection.execute(insert(models.AttivitaLog.__table__), entries)
+        _rollup_counts(connection, entries)
+
+
+def ensure_activity_rollup(connection) -> None:
+    """Popola una tantum i conteggi giornalieri dal registro esistente."""
+    log = models.AttivitaLog.__table__
+    rollup = models.AttivitaGiornaliera.__table__
+    if connection.execute(select(rollup.c.giorno).limit(1)).first():
+        return
+    giorno = func.strftime("%Y-%m-%d", log.c.created_at)
+    source = select(
+        giorno, log.c.stabilimento, log.c.gruppo, log.c.account, log.c.azione, func.count()
+    ).group_by(giorno, log.c.stabilimento, log.c.gruppo, log.c.account, log.c.azione)
+    connection.execute(
+        rollup.insert().from_select(
+            ["giorno", "stabilimento", "gruppo", "account", "azione", "conteggio"], source
+        )
+    )
+
+
+def _drain(limit: int) -> List[Dict[str, object]]:
+    entries = []
+    while len(entries) < limit and _pending:
+        try:
+            entries.append(_pending.popleft())
+        except IndexError:
+            break
+    while len(entries) < limit:
+        try:
+            entries.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return entries
+
+
+def _write_with_retry(batch: List[Dict[str, object]]) -> None:
+    """
+    Scrive il blocco; se il database non è disponibile (OperationalError: bloccato, disco) riprova
+    con attesa crescente, e alla chiusura lo rimette tra le voci in attesa. Un errore diverso
+    dipende dai dati: si riscrive voce per voce e si scarta, registrandola, solo quella non valida.
+    """
+    attesa = FLUSH_INTERVAL_SECONDS
+    while True:
+        try:
+            _write_batch(batch)
+            return
+        except OperationalError:
+            logger.warning(
+                "Registro attività non scrivibile (%d voci), nuovo tentativo tra %.1f s",
+                len(batch),
+                attesa,
+                exc_info=True,
+            )
+            if _stop.wait(attesa):
+                _pending.extendleft(reversed(batch))
+                return
+            attesa = min(attesa * 2, MAX_RETRY_DELAY_SECONDS)
+        except Exception:
+            if len(batch) == 1:
+                logger.exception("Voce del registro attività scartata: %r", batch[0])
+                return
+            for entry in batch:
+                _write_with_retry([entry])
+            return
+
+
+def _writer_loop() -> None:
+    while not _stop.is_set():
+        if _pending:
+            batch = _drain(BATCH_SIZE)
+        else:
+            try:
+                first = _queue.get(timeout=FLUSH_INTERVAL_SECONDS)
+            except queue.Empty:
+                continue
+            # attende un poco per raccogliere altre voci, poi group commit
+            _stop.wait(FLUSH_INTERVAL_SECONDS / 10)
+            batch = [first] + _drain(BATCH_SIZE - 1)
+        _write_with_retry(batch)
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _stop.clear()
+            _writer = threading.Thread(target=_writer_loop, name="plm-activity-log", daemon=True)
+            _writer.start()
+
+
+def flush_activity_log() -> None:
+    """Ferma il writer e scrive sincronicamente tutte le voci ancora in attesa (chiusura server)."""
+    global _writer
+    _stop.set()
+    if _writer is not None:
+        _writer.join(timeout=5)
+        _writer = None
+    while True:
+        batch = _drain(BATCH_SIZE)
+        if not batch:
+            break
+        try:
+            _write_batch(batch)
+        except Exception:
+            logger.exception("Registro attività: %d voci non scritte alla chiusura", len(batch))
+
+
+def _log_failed_write(future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Scrittura registro attività fallita", exc_info=future.exception())
+
+
+atexit.register(flush_activity_log)
+
 
 def log_activity(
     account_ctx: Optional[dict],
@@ -11,14 +203,31 @@ def log_activity(
 ) -> None:
     if not account_ctx or not action:
         return
-    payload = models.AttivitaLog(
-        account=account_ctx.get("account"),
-        stabilimento=account_ctx.get("stabilimento"),
-        gruppo=account_ctx.get("gruppo"),
-        azione=action,
-        riferimento=riferimento,
-        dettagli=dettagli or "",
-    )
-    with database.SessionLocal() as session:
-        session.add(payload)
-        session.commit()
+    entry = {
+        "account": account_ctx.get("account"),
+        "stabilimento": account_ctx.get("stabilimento"),
+        "gruppo": account_ctx.get("gruppo"),
+        "azione": action,
+        "riferimento": riferimento,
+        "dettagli": dettagli or "",
+        "created_at": datetime.now(timezone.utc),
+    }
+    if SYNC_MODE:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # route sincrona: gira già nel threadpool
+            _write_batch([entry], _get_sync_engine())
+        else:
+            # route async: la scrittura (e l'attesa del lock) non blocca l'event loop
+            future = loop.run_in_executor(None, _write_batch, [entry], _get_sync_engine())
+            future.add_done_callback(_log_failed_write)
+        return
+    _ensure_writer()
+    try:
+        _queue.put_nowait(entry)
+    except queue.Full:
+        # DB lento o bloccato: la voce aspetta il writer senza trattenere la richiesta
+        if not _pending:
+            logger.warning("Coda del registro attività piena: voci in attesa nel buffer di riserva")
+        _pending.append(entry)
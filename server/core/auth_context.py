@@ -1,11 +1,19 @@
 from fastapi import Header, HTTPException, status
 from .account_registry import parse_account_header
+from .session_tokens import verify_token
 
 ACCOUNT_HEADER = "X-PLM-Account"
 
 
-def require_account_context(account_header: str = Header(None, alias=ACCOUNT_HEADER)):
-    context = parse_account_header(account_header)
+def require_account_context(
+    authorization: str = Header(None),
+    account_header: str = Header(None, alias=ACCOUNT_HEADER),
+):
+    # token di sessione firmato (nessuna ricerca in anagrafica); X-PLM-Account resta per i client non aggiornati
+    if authorization and authorization.lower().startswith("bearer "):
+        context = verify_token(authorization[7:].strip())
+    else:
+        context = parse_account_header(account_header)
     if not context:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
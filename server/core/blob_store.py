@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# contenuti indicizzati per SHA-256: blobs/ab/abcdef...; i file caricati passano da blobs/tmp
+BLOB_DIR = Path("uploaded_files") / "blobs"
+TEMP_DIR = BLOB_DIR / "tmp"
+
+# righe che puntano a un blob tramite la colonna sha256
+BLOB_OWNERS = (models.FileModel, models.RevisioneFile)
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_DIR / sha256[:2] / sha256
+
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _acquire(connection, sha256: str, dimensione: Optional[int], count: int = 1) -> None:
+    table = models.Blob.__table__
+    stmt = sqlite_insert(table).values(sha256=sha256, dimensione=dimensione or 0, riferimenti=count)
+    connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["sha256"],
+            set_={"riferimenti": table.c.riferimenti + count},
+        )
+    )
+
+
+def _release(connection, sha256: str) -> None:
+    table = models.Blob.__table__
+    connection.execute(
+        update(table).where(table.c.sha256 == sha256).values(riferimenti=table.c.riferimenti - 1)
+    )
+
+
+def _on_insert(mapper, connection, target):
+    if target.sha256:
+        _acquire(connection, target.sha256, target.dimensione)
+
+
+def _on_delete(mapper, connection, target):
+    if target.sha256:
+        _release(connection, target.sha256)
+
+
+def install_blob_refcounts() -> None:
+    """Contatori di riferimento dei blob aggiornati nella stessa transazione delle righe file."""
+    for model in BLOB_OWNERS:
+        if not event.contains(model, "before_insert", _on_insert):
+            event.listen(model, "before_insert", _on_insert)
+            event.listen(model, "after_delete", _on_delete)
+
+
+def purge_unreferenced_blobs(engine) -> int:
+    """Elimina i blob senza più riferimenti (all'avvio, prima di accettare richieste)."""
+    table = models.Blob.__table__
+    with engine.begin() as connection:
+        orfani = connection.execute(select(table.c.sha256).where(table.c.riferimenti <= 0)).scalars().all()
+        if orfani:
+            connection.execute(delete(table).where(table.c.sha256.in_(orfani)))
+    for sha256 in orfani:
+        try:
+            blob_path(sha256).unlink()
+        except FileNotFoundError:
+            pass
+    if orfani:
+        logger.info("Eliminati %d blob non più referenziati", len(orfani))
+    return len(orfani)
+
+
+def purge_untracked_blob_files(engine) -> int:
+    """
+    Elimina i file del blob store senza riga in `blobs`: contenuti spostati da caricamenti il
+    cui commit non è arrivato (all'avvio, prima di accettare richieste).
+    """
+    table = models.Blob.__table__
+    with engine.connect() as connection:
+        noti = set(connection.execute(select(table.c.sha256)).scalars())
+    rimossi = 0
+    for directory in BLOB_DIR.glob("??"):
+        if not directory.is_dir():
+            continue
+        for path in directory.iterdir():
+            if path.is_file() and path.name not in noti:
+                try:
+                    path.unlink()
+                    rimossi += 1
+                except FileNotFoundError:
+                    pass
+    if rimossi:
+        logger.info("Eliminati %d file del blob store senza riferimenti registrati", rimossi)
+    return rimossi
+
+
+def purge_orphan_temp_files() -> int:
+    """Elimina i temporanei (*.part) lasciati da caricamenti interrotti (all'avvio, prima delle richieste)."""
+    rimossi = 0
+    for path in TEMP_DIR.glob("*.part"):
+        try:
+            path.unlink()
+            rimossi += 1
+        except FileNotFoundError:
+            pass
+    if rimossi:
+        logger.info("Eliminati %d file temporanei di caricamenti interrotti", rimossi)
+    return rimossi
+
+
+def import_existing_files(connection):
+    """
+    Sposta nel blob store i file caricati prima del suo arrivo: una copia per contenuto,
+    le righe puntano al blob. Restituisce la pulizia dei vecchi file da eseguire dopo il commit.
+    """
+    vecchi_percorsi = set()
+    hash_noti = {}
+    for model in BLOB_OWNERS:
+        table = model.__table__
+        rows = connection.execute(
+            select(table.c.id, table.c.filepath).where(table.c.sha256.is_(None))
+        ).all()
+        for row_id, filepath in rows:
+            source = Path(filepath)
+            if not source.is_file():
+                continue
+            if source not in hash_noti:
+                hash_noti[source] = hash_file(source)
+            sha256 = hash_noti[source]
+            dimensione = source.stat().st_size
+            destination = blob_path(sha256)
+            if not destination.exists():
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(source, destination)
+                except OSError:
+                    shutil.copy2(source, destination)
+            connection.execute(
+                update(table)
+                .where(table.c.id == row_id)
+                .values(sha256=sha256, dimensione=dimensione, filepath=str(destination))
+            )
+            vecchi_percorsi.add(source)
+
+    # righe caricate dopo la migrazione 5 (hash già noto) ma con il file fuori dal blob store.
+    # I vecchi caricamenti sovrascrivevano i file con lo stesso nome: l'hash registrato può non
+    # descrivere più il contenuto, quindi il file si ricalcola prima di archiviarlo
+    non_migrati = set()
+    for model in BLOB_OWNERS:
+        table = model.__table__
+        rows = connection.execute(
+            select(table.c.id, table.c.filepath, table.c.sha256).where(table.c.sha256.is_not(None))
+        ).all()
+        for row_id, filepath, sha256 in rows:
+            destination = blob_path(sha256)
+            source = Path(filepath)
+            if source == destination:
+                continue
+            if not destination.exists() and source.is_file():
+                if source not in hash_noti:
+                    hash_noti[source] = hash_file(source)
+                if hash_noti[source] == sha256:
+                    destination.parent.mkdir(parents=True, exist_ok=True)
+                    try:
+                        os.link(source, destination)
+                    except OSError:
+                        shutil.copy2(source, destination)
+            if destination.exists():
+                connection.execute(
+                    update(table).where(table.c.id == row_id).values(filepath=str(destination))
+                )
+                vecchi_percorsi.add(source)
+            else:
+                # contenuto originale perso (file sovrascritto o mancante): la riga resta sul vecchio
+                # percorso e senza hash, così non espone un ETag che non corrisponde al file
+                logger.warning(
+                    "%s %d: %s mancante o diverso dall'hash registrato, lasciato fuori dal blob store",
+                    table.name,
+                    row_id,
+                    filepath,
+                )
+                connection.execute(
+                    update(table).where(table.c.id == row_id).values(sha256=None, dimensione=None)
+                )
+                non_migrati.add(source)
+
+    for model in BLOB_OWNERS:
+        table = model.__table__
+        rows = connection.execute(
+            select(table.c.sha256, func.max(table.c.dimensione), func.count())
+            .where(table.c.sha256.is_not(None))
+            .group_by(table.c.sha256)
+        ).all()
+        for sha256, dimensione, count in rows:
+            _acquire(connection, sha256, dimensione, count)
+
+    def cleanup():
+        for path in vecchi_percorsi - non_migrati:
+            try:
+                path.unlink()
+                # le cartelle per revisione restano vuote
+                if path.parent.parent.name == "revisioni":
+                    path.parent.rmdir()
+            except OSError:
+                pass
+
+    return cleanup
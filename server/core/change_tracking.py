@@ -0,0 +1,142 @@
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import models
+from .revision_summary import refresh_revision_summary
+
+CATALOG_COUNTER = "catalogo"
+
+# entità tracciate -> nome pubblicato nel registro modifiche
+TRACKED_ENTITIES = {
+    models.Codice: "codice",
+    models.Revisione: "revisione",
+    models.Distinta: "distinta",
+    models.CertificazioneCampo: "certificazione",
+    models.FileModel: "file",
+    models.RevisioneFile: "revisione_file",
+}
+
+
+def bump_counter(connection, nome: str) -> None:
+    """Incrementa (creandolo se serve) un contatore di versione nella transazione corrente."""
+    stmt = sqlite_insert(models.Contatore.__table__).values(nome=nome, valore=1)
+    connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["nome"],
+            set_={"valore": models.Contatore.__table__.c.valore + 1},
+        )
+    )
+
+
+def read_counter(db, nome: str) -> int:
+    counter = db.get(models.Contatore, nome)
+    return counter.valore if counter else 0
+
+
+def _collect_changes(session):
+    """Restituisce (entità, operazione, oggetto) per ogni riga toccata dal flush corrente."""
+    changes = []
+    for operazione, objects in (
+        ("insert", session.new),
+        ("update", session.dirty),
+        ("delete", session.deleted),
+    ):
+        for obj in list(objects):
+            entita = TRACKED_ENTITIES.get(type(obj))
+            if not entita:
+                continue
+            if operazione == "update" and not session.is_modified(obj):
+                continue
+            changes.append((entita, operazione, obj))
+    return changes
+
+
+def _owner_codice_id(obj):
+    if isinstance(obj, models.Codice):
+        return obj.id
+    if isinstance(obj, (models.Revisione, models.FileModel)):
+        return obj.codice_id
+    if isinstance(obj, models.Distinta):
+        return obj.padre_id
+    return None
+
+
+def _track_changes(session, flush_context):
+    changes = _collect_changes(session)
+    if not changes:
+        return
+    connection = session.connection()
+
+    revisione_ids = {
+        obj.revisione_id
+        for _, _, obj in changes
+        if isinstance(obj, (models.CertificazioneCampo, models.RevisioneFile))
+    }
+    revisione_owner = {}
+    if revisione_ids:
+        rows = connection.execute(
+            select(models.Revisione.id, models.Revisione.codice_id).where(models.Revisione.id.in_(revisione_ids))
+        )
+        revisione_owner = dict(rows.all())
+
+    def owner(obj):
+        codice_id = _owner_codice_id(obj)
+        if codice_id is None and hasattr(obj, "revisione_id"):
+            codice_id = revisione_owner.get(obj.revisione_id)
+        return codice_id
+
+    owners = {id(obj): owner(obj) for _, _, obj in changes}
+    codice_ids = {value for value in owners.values() if value is not None}
+    codici_map = {}
+    if codice_ids:
+        rows = connection.execute(
+            select(models.Codice.id, models.Codice.codice).where(models.Codice.id.in_(codice_ids))
+        )
+        codici_map = dict(rows.all())
+    for entita, operazione, obj in changes:
+        if isinstance(obj, models.Codice) and obj.id not in codici_map:
+            codici_map[obj.id] = obj.codice
+
+    # versioni per ETag (un codice appena inserito parte già da versione 1)
+    bump_ids = {
+        owners[id(obj)]
+        for entita, operazione, obj in changes
+        if owners[id(obj)] is not None and not (isinstance(obj, models.Codice) and operazione == "insert")
+    }
+    if bump_ids:
+        connection.execute(
+            update(models.Codice.__table__)
+            .where(models.Codice.id.in_(bump_ids))
+            .values(versione=models.Codice.versione + 1)
+        )
+    # riepilogo revisioni denormalizzato su codici (rilascio, ultima revisione, stato, conteggio)
+    refresh_revision_summary(
+        connection,
+        {owners[id(obj)] for _, _, obj in changes if isinstance(obj, models.Revisione)} - {None},
+    )
+    if any(isinstance(obj, (models.Codice, models.Revisione)) for _, _, obj in changes):
+        bump_counter(connection, CATALOG_COUNTER)
+
+    # registro modifiche, nella stessa transazione della modifica
+    connection.execute(
+        insert(models.RegistroModifica.__table__),
+        [
+            {
+                "entita": entita,
+                "operazione": operazione,
+                "entita_id": obj.id,
+                "codice": codici_map.get(owners[id(obj)]),
+            }
+            for entita, operazione, obj in changes
+        ],
+    )
+
+
+def install_change_tracking(session_factory) -> None:
+    """Aggiorna versioni (ETag) e registro modifiche nella stessa transazione delle modifiche."""
+    if not event.contains(session_factory, "after_flush", _track_changes):
+        event.listen(session_factory, "after_flush", _track_changes)
+
+
+def catalog_version(db) -> int:
+    return read_counter(db, CATALOG_COUNTER)
@@ -0,0 +1,49 @@
+from sqlalchemy import cast, func, insert, Integer, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+CODE_SEQUENCE = "codici"
+MAX_PROGRESSIVE = 999999
+
+
+def _max_existing_progressive(connection) -> int:
+    """Numero progressivo più alto fra i codici già presenti (cifre 3-8)."""
+    progressivo = func.substr(models.Codice.codice, 3, 6)
+    stmt = select(func.max(cast(progressivo, Integer))).where(
+        func.length(models.Codice.codice) >= 8,
+        progressivo.op("GLOB")("[0-9][0-9][0-9][0-9][0-9][0-9]"),
+    )
+    return connection.execute(stmt).scalar() or 0
+
+
+def _seed_sequence(connection, nome: str) -> None:
+    # INSERT OR IGNORE: se un altro worker ha già inizializzato il contatore non succede nulla
+    start = _max_existing_progressive(connection)
+    connection.execute(
+        insert(models.Contatore).prefix_with("OR IGNORE").values(nome=nome, valore=start)
+    )
+
+
+def backfill_code_sequence(connection) -> None:
+    """Inizializza una sola volta il contatore a partire dai codici esistenti."""
+    _seed_sequence(connection, CODE_SEQUENCE)
+
+
+def allocate_progressive(db: Session, nome: str = CODE_SEQUENCE) -> int:
+    """
+    Restituisce il prossimo numero progressivo nella transazione corrente.
+    L'UPDATE ... RETURNING prende il lock di scrittura di SQLite, quindi
+    richieste concorrenti (anche da worker diversi) ottengono numeri distinti.
+    """
+    stmt = (
+        update(models.Contatore)
+        .where(models.Contatore.nome == nome)
+        .values(valore=models.Contatore.valore + 1)
+        .returning(models.Contatore.valore)
+    )
+    valore = db.execute(stmt).scalar()
+    if valore is None:
+        _seed_sequence(db.connection(), nome)
+        valore = db.execute(stmt).scalar()
+    return valore
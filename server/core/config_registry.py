@@ -0,0 +1,77 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# intervallo minimo fra due controlli di mtime/inode dello stesso file:
+# nel frattempo le richieste usano il valore in memoria senza toccare il filesystem
+CHECK_INTERVAL_SECONDS = 2.0
+
+
+class CachedConfig(Generic[T]):
+    """File di configurazione letto e interpretato una sola volta, ricaricato solo se cambia."""
+
+    def __init__(self, path: Path, parser: Callable[[str], T], ensure_exists: Optional[Callable[[], None]] = None):
+        self.path = path
+        self._parser = parser
+        self._ensure_exists = ensure_exists
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._digest = ""
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._checked_at = 0.0
+
+    def _stat_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def _refresh(self, force: bool = False) -> None:
+        with self._lock:
+            if self._ensure_exists:
+                self._ensure_exists()
+            signature = self._stat_signature()
+            if force or self._value is None or signature != self._signature:
+                raw = self.path.read_text(encoding="utf-8") if signature else ""
+                self._value = self._parser(raw)
+                self._digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+                self._signature = signature
+            self._checked_at = time.monotonic()
+
+    def get(self) -> T:
+        if self._value is None or time.monotonic() - self._checked_at >= CHECK_INTERVAL_SECONDS:
+            self._refresh()
+        return self._value
+
+    @property
+    def digest(self) -> str:
+        """Impronta del contenuto: uguale su tutti i worker, utile per gli ETag."""
+        self.get()
+        return self._digest
+
+    def reload(self) -> T:
+        self._refresh(force=True)
+        return self._value
+
+
+_registry: Dict[str, CachedConfig] = {}
+
+
+def register_config(name: str, config: CachedConfig) -> CachedConfig:
+    _registry[name] = config
+    return config
+
+
+def reload_all() -> Dict[str, str]:
+    """Ricarica tutti i file registrati e restituisce l'impronta di ciascuno."""
+    result = {}
+    for name, config in _registry.items():
+        config.reload()
+        result[name] = config.digest
+    return result
@@ -1,38 +1,155 @@
 # server/core/database.py
 
-from sqlalchemy import create_engine
+import os
+from typing import Callable, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
-# Percorso del database locale
-SQLALCHEMY_DATABASE_URL = "sqlite:///./plm.db"
+# Percorso del database (PLM_DATABASE_URL per puntare a un altro file SQLite, es. sqlite:////srv/plm/plm.db)
+SQLALCHEMY_DATABASE_URL = os.environ.get("PLM_DATABASE_URL", "sqlite:///./plm.db")
 
-# Connessione con SQLite
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Profilo SQLite: WAL permette letture concorrenti a una scrittura, busy_timeout fa attendere
+# invece di fallire con "database is locked"
+JOURNAL_MODE = os.environ.get("PLM_SQLITE_JOURNAL_MODE", "WAL")
+SYNCHRONOUS = os.environ.get("PLM_SQLITE_SYNCHRONOUS", "NORMAL")
+BUSY_TIMEOUT_MS = int(os.environ.get("PLM_SQLITE_BUSY_TIMEOUT_MS", 10000))
+MMAP_SIZE = int(os.environ.get("PLM_SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# negativo = KiB (-65536 -> 64 MiB per connessione)
+CACHE_SIZE = int(os.environ.get("PLM_SQLITE_CACHE_SIZE", -65536))
+FOREIGN_KEYS = os.environ.get("PLM_SQLITE_FOREIGN_KEYS", "1").strip().lower() in {"1", "true", "yes", "on"}
 
-# Crea la base per i modelli
-Base = declarative_base()
+READ_POOL_SIZE = int(os.environ.get("PLM_DB_READ_POOL_SIZE", 8))
+READ_MAX_OVERFLOW = int(os.environ.get("PLM_DB_READ_MAX_OVERFLOW", 16))
+# attesa massima (secondi) per la connessione di scrittura quando è occupata
+WRITE_TIMEOUT_SECONDS = float(os.environ.get("PLM_DB_WRITE_TIMEOUT", 30))
+
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+# connessione di scrittura unica, pragma, FTS5 e migrazioni presuppongono SQLite
+if _url.get_backend_name() != "sqlite":
+    raise RuntimeError(
+        f"PLM_DATABASE_URL deve essere un URL sqlite:/// (ricevuto {_url.render_as_string()}): "
+        "altri database non sono supportati"
+    )
+_IN_MEMORY = _url.database in (None, "", ":memory:")
+_memory_engine = None
+
+T = TypeVar("T")
 
-# Sessione DB
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _install_sqlite_pragmas(target_engine, read_only: bool) -> None:
+    @event.listens_for(target_engine, "connect")
+    def _set_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        if not read_only:
+            # journal_mode è persistente nel file: lo imposta solo chi scrive
+            cursor.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = {CACHE_SIZE}")
+        cursor.execute(f"PRAGMA foreign_keys = {'ON' if FOREIGN_KEYS else 'OFF'}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
 
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./plm.db"
+def make_engine(read_only: bool = False, pool_size: int = 1, max_overflow: int = 0, pool_timeout: float = 30):
+    """Engine sul database configurato, con i pragma del profilo SQLite applicati ad ogni connessione."""
+    global _memory_engine
+    if _IN_MEMORY:
+        # un database in memoria esiste solo nella propria connessione: un unico engine condiviso
+        if _memory_engine is None:
+            _memory_engine = create_engine(
+                SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+            )
+            _install_sqlite_pragmas(_memory_engine, read_only=False)
+        return _memory_engine
+    new_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
+    _install_sqlite_pragmas(new_engine, read_only)
+    return new_engine
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+
+# Scrittura: una sola connessione, le transazioni si mettono in coda sul pool invece di
+# contendersi il lock del file (niente SQLITE_BUSY sull'upgrade lettura -> scrittura).
+# La usano anche il registro attività e le route async (run_write). Unica eccezione: la modalità
+# PLM_ACTIVITY_SYNC del registro attività, che scrive con una connessione propria
+engine = make_engine(pool_size=1, max_overflow=0, pool_timeout=WRITE_TIMEOUT_SECONDS)
+
+# Lettura: pool di connessioni in sola lettura (query_only) per le route GET
+read_engine = make_engine(read_only=True, pool_size=READ_POOL_SIZE, max_overflow=READ_MAX_OVERFLOW)
+
+# Lettura asincrona (aiosqlite) per le route async: stesso database e pragma del pool di lettura
+# (query_only), le query non occupano thread del threadpool. Non scrive: le route async scrivono
+# con run_write sulla connessione di scrittura, in coda con tutte le altre scritture
+ASYNC_DATABASE_URL = _url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **(
+        {}
+        if _IN_MEMORY
+        else {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": READ_POOL_SIZE,
+            "max_overflow": READ_MAX_OVERFLOW,
+        }
+    ),
 )
+_install_sqlite_pragmas(async_engine.sync_engine, read_only=True)
 
+# Crea la base per i modelli
 Base = declarative_base()
 
+# Sessioni DB
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# expire_on_commit=False: dopo il commit gli oggetti restano leggibili senza lazy load (vietato in async)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
-# ✅ Questa funzione fornisce la sessione DB a FastAPI
+# ✅ Questa funzione fornisce la sessione DB a FastAPI (route che scrivono)
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# ✅ Sessione in sola lettura per le route GET: non occupa la connessione di scrittura
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ✅ Sessione asincrona in sola lettura per le route async def
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def run_write(fn: Callable[..., T], *args) -> T:
+    """
+    Scrittura da una route async: `fn(db, *args)` gira nel threadpool con una sessione sulla
+    connessione di scrittura (si mette in coda come le route sincrone) e fa il proprio commit.
+    """
+
+    def _run():
+        with SessionLocal() as db:
+            return fn(db, *args)
+
+    return await run_in_threadpool(_run)
@@ -1,5 +1,7 @@
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple
+
+from .config_registry import CachedConfig, register_config
 
 FORM_CONFIG_PATH = Path(__file__).resolve().parent.parent / "form_config.txt"
 
@@ -17,11 +19,9 @@ def _ensure_config_exists() -> None:
     FORM_CONFIG_PATH.write_text("\n".join(lines), encoding="utf-8")
 
 
-def load_form_fields() -> List[Dict[str, str]]:
-    _ensure_config_exists()
-    raw_lines = FORM_CONFIG_PATH.read_text(encoding="utf-8").splitlines()
-    fields: List[Dict[str, str]] = []
-    for idx, line in enumerate(raw_lines):
+def _parse_form_fields(raw_text: str) -> Tuple[Tuple[str, str, int], ...]:
+    fields: List[Tuple[str, str, int]] = []
+    for idx, line in enumerate(raw_text.splitlines()):
         stripped = line.strip()
         if not stripped or stripped.startswith("#"):
             continue
@@ -32,7 +32,14 @@ def load_form_fields() -> List[Dict[str, str]]:
         label = parts[1] if len(parts) > 1 and parts[1] else name.title()
         if not name:
             continue
-        fields.append({"name": name, "label": label, "order": idx})
+        fields.append((name, label, idx))
     if fields:
-        return fields
-    return [{"name": name, "label": label, "order": pos} for pos, (name, label) in enumerate(DEFAULT_FIELDS)]
+        return tuple(fields)
+    return tuple((name, label, pos) for pos, (name, label) in enumerate(DEFAULT_FIELDS))
+
+
+_config = register_config("form", CachedConfig(FORM_CONFIG_PATH, _parse_form_fields, _ensure_config_exists))
+
+
+def load_form_fields() -> List[Dict[str, str]]:
+    return [{"name": name, "label": label, "order": order} for name, label, order in _config.get()]
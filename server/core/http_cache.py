@@ -0,0 +1,58 @@
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+
+def make_etag(*parts) -> str:
+    """ETag forte calcolato dai contatori di versione (non dal payload serializzato)."""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {value.strip().removeprefix("W/") for value in header.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+class HashedFileResponse(FileResponse):
+    """FileResponse con ETag dal contenuto: If-Range confronta anche l'hash, non solo mtime/size."""
+
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:
+        etag = self.headers.get("etag")
+        if etag and http_if_range.strip() == etag:
+            return True
+        return super()._should_use_range(http_if_range, stat_result)
+
+
+def file_download(
+    request: Request,
+    path: str,
+    filename: str,
+    sha256: Optional[str] = None,
+    media_type: Optional[str] = None,
+) -> Response:
+    """
+    Invia un file dal disco a blocchi (nessun buffer in memoria), con Range/If-Range e
+    Content-Length; l'ETag è lo SHA-256 salvato, quindi resta valido anche se il file viene spostato.
+    """
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File non presente sul server")
+    headers = {}
+    if sha256:
+        etag = f'"{sha256}"'
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        headers["ETag"] = etag
+    return HashedFileResponse(path, filename=filename, media_type=media_type or None, headers=headers)
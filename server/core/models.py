@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship 
 from .database import Base
 
@@ -12,6 +12,17 @@ class Codice(Base):
     descrizione = Column(String)
     quantita = Column(Float)
     ubicazione = Column(String)
+    # incrementata ad ogni modifica del codice, delle sue revisioni, file o distinta (ETag)
+    versione = Column(Integer, nullable=False, default=1, server_default="1")
+    # riepilogo delle revisioni, mantenuto ad ogni modifica di una revisione (vedi revision_summary)
+    has_released_revision = Column(Boolean, nullable=False, default=False, server_default="0")
+    latest_revision_index = Column(Integer, nullable=True)
+    latest_state = Column(String(collation="NOCASE"), nullable=True, index=True)
+    revision_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_codici_released_codice", "has_released_revision", "codice"),
+    )
 
     #Aggiungiamo il link ai file CAD associati
     files = relationship("FileModel", back_populates="codice", cascade="all, delete-orphan")
@@ -27,10 +38,12 @@ class FileModel(Base):
     __tablename__ = "files"
 
     id = Column(Integer, primary_key=True, index=True)
-    codice_id = Column(Integer, ForeignKey("codici.id"))
+    codice_id = Column(Integer, ForeignKey("codici.id"), index=True)
     filename = Column(String, nullable=False)
     filepath = Column(String, nullable=False)
     filetype = Column(String, nullable=True)
+    dimensione = Column(Integer, nullable=True)
+    sha256 = Column(String, nullable=True)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
     codice = relationship("Codice", back_populates="files")
@@ -48,6 +61,9 @@ class Revisione(Base):
     is_released = Column(Boolean, default=False, nullable=False)
     released_at = Column(DateTime(timezone=True), nullable=True)
 
+    # un solo indice per codice; copre anche le ricerche per codice_id
+    __table_args__ = (Index("ux_revisioni_codice_indice", "codice_id", "indice", unique=True),)
+
     codice = relationship("Codice", back_populates="revisioni")
     certificazione = relationship(
         "CertificazioneCampo",
@@ -67,7 +83,7 @@ class CertificazioneCampo(Base):
     __tablename__ = "certificazioni"
 
     id = Column(Integer, primary_key=True, index=True)
-    revisione_id = Column(Integer, ForeignKey("revisioni.id"), nullable=False)
+    revisione_id = Column(Integer, ForeignKey("revisioni.id"), nullable=False, index=True)
     nome = Column(String, nullable=False)
     valore = Column(String, nullable=True)
     ordine = Column(Integer, nullable=False, default=0)
@@ -79,22 +95,40 @@ class RevisioneFile(Base):
     __tablename__ = "revisioni_file"
 
     id = Column(Integer, primary_key=True, index=True)
-    revisione_id = Column(Integer, ForeignKey("revisioni.id"), nullable=False)
+    revisione_id = Column(Integer, ForeignKey("revisioni.id"), nullable=False, index=True)
     filename = Column(String, nullable=False)
     filepath = Column(String, nullable=False)
     mimetype = Column(String, nullable=True)
+    dimensione = Column(Integer, nullable=True)
+    sha256 = Column(String, nullable=True)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
     revisione = relationship("Revisione", back_populates="files")
 
 
+#Caricamento a blocchi in corso (upload_sessions): i blocchi sono su disco, qui i metadati
+class UploadSessione(Base):
+    __tablename__ = "upload_sessioni"
+
+    id = Column(String, primary_key=True)
+    revisione_id = Column(Integer, ForeignKey("revisioni.id"), nullable=False, index=True)
+    account = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    mimetype = Column(String, nullable=True)
+    dimensione = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    sha256 = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
 #Modello per le distinte base (BOM)
 class Distinta(Base):
     __tablename__ = "distinte"
 
     id = Column(Integer, primary_key=True, index=True)
-    padre_id = Column(Integer, ForeignKey("codici.id"), nullable=False)
-    figlio_id = Column(Integer, ForeignKey("codici.id"), nullable=False)
+    padre_id = Column(Integer, ForeignKey("codici.id"), nullable=False, index=True)
+    figlio_id = Column(Integer, ForeignKey("codici.id"), nullable=False, index=True)
     quantita = Column(Float, default=1.0)
 
     padre = relationship("Codice", foreign_keys=[padre_id], backref="componenti")
@@ -113,6 +147,63 @@ class AttivitaLog(Base):
     dettagli = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # indici composti per i filtri di GET /attivita con paginazione keyset su id
+    __table_args__ = (
+        Index("ix_attivita_log_account_id", "account", "id"),
+        Index("ix_attivita_log_stabilimento_gruppo_id", "stabilimento", "gruppo", "id"),
+        Index("ix_attivita_log_azione_id", "azione", "id"),
+        Index("ix_attivita_log_riferimento", "riferimento"),
+        Index("ix_attivita_log_created_at", "created_at"),
+    )
+
+
+#Conteggi giornalieri del registro attività, aggiornati dal writer ad ogni blocco scritto
+class AttivitaGiornaliera(Base):
+    __tablename__ = "attivita_giornaliera"
+
+    giorno = Column(String, primary_key=True)
+    stabilimento = Column(String, primary_key=True)
+    gruppo = Column(String, primary_key=True)
+    account = Column(String, primary_key=True)
+    azione = Column(String, primary_key=True)
+    conteggio = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_attivita_giornaliera_account_giorno", "account", "giorno"),)
+
+
+#Anagrafica account: stabilimento -> gruppo -> account
+class Stabilimento(Base):
+    __tablename__ = "stabilimenti"
+
+    id = Column(Integer, primary_key=True, index=True)
+    nome = Column(String(collation="NOCASE"), unique=True, nullable=False, index=True)
+
+    gruppi = relationship("Gruppo", back_populates="stabilimento", cascade="all, delete-orphan")
+
+
+class Gruppo(Base):
+    __tablename__ = "gruppi"
+
+    id = Column(Integer, primary_key=True, index=True)
+    stabilimento_id = Column(Integer, ForeignKey("stabilimenti.id"), nullable=False, index=True)
+    nome = Column(String(collation="NOCASE"), nullable=False)
+
+    __table_args__ = (UniqueConstraint("stabilimento_id", "nome", name="uq_gruppi_stabilimento_nome"),)
+
+    stabilimento = relationship("Stabilimento", back_populates="gruppi")
+    accounts = relationship("Account", back_populates="gruppo")
+
+
+class Account(Base):
+    __tablename__ = "accounts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    gruppo_id = Column(Integer, ForeignKey("gruppi.id"), nullable=False, index=True)
+    nome = Column(String(collation="NOCASE"), unique=True, nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    gruppo = relationship("Gruppo", back_populates="accounts")
+
 
 class AccountCredential(Base):
     __tablename__ = "account_credentials"
@@ -121,3 +212,33 @@ class AccountCredential(Base):
     account = Column(String, unique=True, nullable=False, index=True)
     password_hash = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+#Contatori progressivi (es. numerazione globale dei codici)
+class Contatore(Base):
+    __tablename__ = "contatori"
+
+    nome = Column(String, primary_key=True)
+    valore = Column(Integer, nullable=False, default=0)
+
+
+#Contenuti dei file per hash (blob_store): più righe file possono puntare allo stesso blob
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    sha256 = Column(String, primary_key=True)
+    dimensione = Column(Integer, nullable=False)
+    riferimenti = Column(Integer, nullable=False, default=0, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+#Registro append-only delle modifiche (sincronizzazione incrementale dei client)
+class RegistroModifica(Base):
+    __tablename__ = "registro_modifiche"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entita = Column(String, nullable=False)
+    operazione = Column(String, nullable=False)
+    entita_id = Column(Integer, nullable=True)
+    codice = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,6 +1,35 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# costo bcrypt configurabile: gli hash con un costo diverso vengono aggiornati al login successivo
+HASH_ROUNDS = int(os.environ.get("PLM_BCRYPT_ROUNDS", 12))
+HASH_WORKERS = int(os.environ.get("PLM_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+HASH_MAX_PENDING = int(os.environ.get("PLM_HASH_MAX_PENDING", 64))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=HASH_ROUNDS)
+
+# pool dedicato: bcrypt rilascia il GIL, quindi i thread lavorano in parallelo
+# senza occupare il threadpool condiviso che serve le altre richieste
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="plm-hash")
+_stats_lock = threading.Lock()
+_stats = {
+    "pending": 0,
+    "completed": 0,
+    "rejected": 0,
+    "wait_total_ms": 0.0,
+    "wait_max_ms": 0.0,
+    "wait_last_ms": 0.0,
+}
+
+
+class HashPoolBusy(RuntimeError):
+    """Troppe operazioni di hashing in coda."""
 
 
 def hash_password(password: str) -> str:
@@ -11,3 +40,55 @@ def verify_password(password: str, hashed: str) -> bool:
     if not hashed:
         return False
     return pwd_context.verify(password, hashed)
+
+
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Verifica la password e, se il costo configurato è cambiato, restituisce il nuovo hash."""
+    if not hashed:
+        return False, None
+    return pwd_context.verify_and_update(password, hashed)
+
+
+async def _run_in_hash_pool(func: Callable, *args):
+    with _stats_lock:
+        if _stats["pending"] >= HASH_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise HashPoolBusy("Coda di autenticazione piena")
+        _stats["pending"] += 1
+    submitted = time.perf_counter()
+
+    def job():
+        wait_ms = (time.perf_counter() - submitted) * 1000
+        with _stats_lock:
+            _stats["wait_total_ms"] += wait_ms
+            _stats["wait_max_ms"] = max(_stats["wait_max_ms"], wait_ms)
+            _stats["wait_last_ms"] = wait_ms
+        return func(*args)
+
+    try:
+        return await asyncio.wrap_future(_executor.submit(job))
+    finally:
+        with _stats_lock:
+            _stats["pending"] -= 1
+            _stats["completed"] += 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_hash_pool(hash_password, password)
+
+
+async def verify_and_update_async(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return await _run_in_hash_pool(verify_and_update, password, hashed)
+
+
+def hash_pool_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    completed = stats["completed"]
+    stats["wait_avg_ms"] = stats["wait_total_ms"] / completed if completed else 0.0
+    stats.update({"workers": HASH_WORKERS, "max_pending": HASH_MAX_PENDING, "rounds": HASH_ROUNDS})
+    return stats
+
+
+def shutdown_hash_pool() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
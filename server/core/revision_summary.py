@@ -0,0 +1,31 @@
+from sqlalchemy import and_, exists, func, select, update
+
+from . import models
+
+
+def refresh_revision_summary(connection, codice_ids=None) -> None:
+    """
+    Ricalcola in un solo UPDATE i campi di riepilogo revisioni su `codici`
+    (rilasciato, ultima revisione, stato dell'ultima revisione, numero revisioni).
+    Senza `codice_ids` aggiorna tutti i codici (backfill).
+    """
+    rev = models.Revisione
+    codice = models.Codice
+    latest = (
+        select(rev.indice, rev.stato)
+        .where(rev.codice_id == codice.id)
+        .order_by(rev.indice.desc())
+        .limit(1)
+        .correlate(codice)
+    )
+    stmt = update(codice.__table__).values(
+        has_released_revision=exists().where(and_(rev.codice_id == codice.id, rev.is_released.is_(True))),
+        latest_revision_index=latest.with_only_columns(rev.indice).scalar_subquery(),
+        latest_state=latest.with_only_columns(rev.stato).scalar_subquery(),
+        revision_count=select(func.count(rev.id)).where(rev.codice_id == codice.id).correlate(codice).scalar_subquery(),
+    )
+    if codice_ids is not None:
+        if not codice_ids:
+            return
+        stmt = stmt.where(codice.id.in_(codice_ids))
+    connection.execute(stmt)
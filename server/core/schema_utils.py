@@ -1,18 +1,142 @@
+import logging
+
 from sqlalchemy import inspect, text
 
+from . import models
+from .activity_logger import ensure_activity_rollup
+from .blob_store import import_existing_files
+from .code_allocator import backfill_code_sequence
 from .database import engine
+from .revision_summary import refresh_revision_summary
+from .search_index import ensure_search_index
+
+logger = logging.getLogger(__name__)
 
 
-def ensure_schema():
+def _add_legacy_columns(connection):
     """Aggiunge colonne mancanti senza migrazioni complesse."""
-    with engine.begin() as connection:
-        inspector = inspect(connection)
-        if not inspector.has_table("revisioni"):
-            return
-        columns = {col["name"] for col in inspector.get_columns("revisioni")}
-        if "is_released" not in columns:
-            connection.execute(
-                text("ALTER TABLE revisioni ADD COLUMN is_released BOOLEAN NOT NULL DEFAULT 0")
-            )
-        if "released_at" not in columns:
-            connection.execute(text("ALTER TABLE revisioni ADD COLUMN released_at DATETIME"))
+    inspector = inspect(connection)
+    columns = {col["name"] for col in inspector.get_columns("revisioni")}
+    if "is_released" not in columns:
+        connection.execute(
+            text("ALTER TABLE revisioni ADD COLUMN is_released BOOLEAN NOT NULL DEFAULT 0")
+        )
+    if "released_at" not in columns:
+        connection.execute(text("ALTER TABLE revisioni ADD COLUMN released_at DATETIME"))
+
+    codici_columns = {col["name"] for col in inspector.get_columns("codici")}
+    if "versione" not in codici_columns:
+        connection.execute(
+            text("ALTER TABLE codici ADD COLUMN versione INTEGER NOT NULL DEFAULT 1")
+        )
+    if "has_released_revision" not in codici_columns:
+        connection.execute(
+            text("ALTER TABLE codici ADD COLUMN has_released_revision BOOLEAN NOT NULL DEFAULT 0")
+        )
+        connection.execute(text("ALTER TABLE codici ADD COLUMN latest_revision_index INTEGER"))
+        connection.execute(text("ALTER TABLE codici ADD COLUMN latest_state VARCHAR COLLATE NOCASE"))
+        connection.execute(
+            text("ALTER TABLE codici ADD COLUMN revision_count INTEGER NOT NULL DEFAULT 0")
+        )
+        refresh_revision_summary(connection)
+
+
+def _add_columns(connection, table: str, columns: dict):
+    existing = {col["name"] for col in inspect(connection).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in existing:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _create_indexes(connection, *tables):
+    for model in tables:
+        for index in model.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _baseline(connection):
+    # tabelle nuove, colonne aggiunte a mano in passato e indici di catalogo/registro
+    models.Base.metadata.create_all(bind=connection)
+    _add_legacy_columns(connection)
+    _create_indexes(connection, models.Codice, models.AttivitaLog)
+
+
+def _seed_counters(connection):
+    backfill_code_sequence(connection)
+    ensure_activity_rollup(connection)
+
+
+def _foreign_key_indexes(connection):
+    duplicati = connection.execute(
+        text("SELECT codice_id, indice FROM revisioni GROUP BY codice_id, indice HAVING COUNT(*) > 1 LIMIT 10")
+    ).all()
+    if duplicati:
+        raise RuntimeError(
+            "Revisioni duplicate (codice_id, indice) da correggere prima della migrazione: "
+            + ", ".join(f"{codice_id}/{indice}" for codice_id, indice in duplicati)
+        )
+    _create_indexes(
+        connection,
+        models.FileModel,
+        models.Revisione,
+        models.CertificazioneCampo,
+        models.RevisioneFile,
+        models.Distinta,
+    )
+
+
+def _file_checksums(connection):
+    # i file caricati prima restano senza dimensione/hash (NULL)
+    for table in ("files", "revisioni_file"):
+        _add_columns(connection, table, {"dimensione": "INTEGER", "sha256": "VARCHAR"})
+
+
+def _blob_store(connection):
+    models.Blob.__table__.create(connection, checkfirst=True)
+    return import_existing_files(connection)
+
+
+def _upload_sessions(connection):
+    models.UploadSessione.__table__.create(connection, checkfirst=True)
+
+
+# Migrazioni in ordine: ogni passo è idempotente, così un database creato prima del versionamento
+# (user_version = 0) le attraversa tutte senza errori. Un passo può restituire una funzione
+# da eseguire dopo il commit (es. rimozione di file non più usati)
+MIGRATIONS = [
+    (1, "schema di base", _baseline),
+    (2, "indice full-text", ensure_search_index),
+    (3, "contatori", _seed_counters),
+    (4, "indici chiavi esterne", _foreign_key_indexes),
+    (5, "dimensione e hash dei file", _file_checksums),
+    (6, "blob store dei file", _blob_store),
+    (7, "sessioni di caricamento", _upload_sessions),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection) -> int:
+    return connection.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def run_migrations():
+    """
+    Porta il database all'ultima versione dello schema. Se la versione registrata
+    (PRAGMA user_version) è già quella attesa non esegue alcuna introspezione.
+    """
+    with engine.connect() as connection:
+        current = schema_version(connection)
+    if current >= SCHEMA_VERSION:
+        if current > SCHEMA_VERSION:
+            logger.warning("Schema database v%d più recente del server (v%d)", current, SCHEMA_VERSION)
+        return
+
+    for version, nome, step in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Migrazione schema v%d: %s", version, nome)
+        with engine.begin() as connection:
+            after_commit = step(connection)
+            connection.execute(text(f"PRAGMA user_version = {version}"))
+        if callable(after_commit):
+            after_commit()
@@ -0,0 +1,66 @@
+import re
+from typing import Optional
+
+from sqlalchemy import inspect, text
+
+FTS_TABLE = "codici_fts"
+
+_FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        codice, descrizione, ubicazione,
+        content='codici', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON codici BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, codice, descrizione, ubicazione)
+        VALUES (new.id, new.codice, new.descrizione, new.ubicazione);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON codici BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, codice, descrizione, ubicazione)
+        VALUES ('delete', old.id, old.codice, old.descrizione, old.ubicazione);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF codice, descrizione, ubicazione ON codici BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, codice, descrizione, ubicazione)
+        VALUES ('delete', old.id, old.codice, old.descrizione, old.ubicazione);
+        INSERT INTO {FTS_TABLE}(rowid, codice, descrizione, ubicazione)
+        VALUES (new.id, new.codice, new.descrizione, new.ubicazione);
+    END
+    """,
+]
+
+_PHRASE_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def ensure_search_index(connection) -> None:
+    """Crea l'indice FTS5 e i trigger di sincronizzazione; al primo avvio indicizza i codici esistenti."""
+    if inspect(connection).has_table(FTS_TABLE):
+        return
+    for statement in _FTS_DDL:
+        connection.execute(text(statement))
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def build_match_query(raw: str) -> Optional[str]:
+    """
+    Converte il testo digitato dall'utente in una query FTS5 sicura:
+    - "testo fra virgolette" -> ricerca per frase esatta
+    - ogni altra parola -> ricerca per prefisso (parola*)
+    I termini sono combinati in AND.
+    """
+    terms = []
+    for phrase, word in _PHRASE_RE.findall(raw or ""):
+        if phrase.strip():
+            terms.append('"{}"'.format(phrase.strip().replace('"', '""')))
+        elif word:
+            word = word.replace('"', "")
+            if word:
+                terms.append('"{}"*'.format(word))
+    return " ".join(terms) or None
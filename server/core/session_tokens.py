@@ -0,0 +1,95 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SECRET_FILE = BASE_DIR / "session_secret.key"
+SECRET_ENV = "PLM_SESSION_SECRET"
+
+ACCESS_TOKEN_TTL = int(os.environ.get("PLM_ACCESS_TOKEN_TTL", 12 * 3600))
+REFRESH_TOKEN_TTL = int(os.environ.get("PLM_REFRESH_TOKEN_TTL", 30 * 24 * 3600))
+
+
+def _load_secret() -> bytes:
+    """Chiave HMAC da variabile d'ambiente o, in mancanza, da file generato una volta (condiviso dai worker)."""
+    from_env = os.environ.get(SECRET_ENV)
+    if from_env:
+        return from_env.encode("utf-8")
+    try:
+        fd = os.open(SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return SECRET_FILE.read_bytes().strip()
+    secret = base64.urlsafe_b64encode(os.urandom(32))
+    with os.fdopen(fd, "wb") as handle:
+        handle.write(secret)
+    return secret
+
+
+_SECRET = _load_secret()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(_SECRET, body.encode("ascii"), hashlib.sha256).digest())
+
+
+def _make_token(context: Dict[str, str], kind: str, ttl: int) -> tuple[str, int]:
+    expires_at = int(time.time()) + ttl
+    payload = {
+        "s": context["stabilimento"],
+        "g": context["gruppo"],
+        "a": context["account"],
+        "t": kind,
+        "exp": expires_at,
+    }
+    body = _b64encode(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return f"{body}.{_sign(body)}", expires_at
+
+
+def issue_tokens(context: Dict[str, str]) -> Dict[str, object]:
+    access_token, expires_at = _make_token(context, "access", ACCESS_TOKEN_TTL)
+    refresh_token, _ = _make_token(context, "refresh", REFRESH_TOKEN_TTL)
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_at": expires_at,
+    }
+
+
+def verify_token(token: str, kind: str = "access") -> Optional[Dict[str, str]]:
+    """Restituisce il contesto account contenuto nel token se firma, tipo e scadenza sono validi."""
+    if not token or token.count(".") != 1:
+        return None
+    body, signature = token.split(".")
+    # il token arriva dal client: qualunque input malformato vale come token non valido (401, non 500)
+    try:
+        if not hmac.compare_digest(signature.encode("ascii"), _sign(body).encode("ascii")):
+            return None
+        payload = json.loads(_b64decode(body))
+    except (UnicodeError, ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get("t") != kind:
+        return None
+    if not isinstance(payload.get("exp"), (int, float)) or payload["exp"] < time.time():
+        return None
+    try:
+        return {
+            "stabilimento": payload["s"],
+            "gruppo": payload["g"],
+            "account": payload["a"],
+        }
+    except KeyError:
+        return None
@@ -1,5 +1,8 @@
 from pathlib import Path
-from typing import Dict, List
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Tuple
+
+from .config_registry import CachedConfig, register_config
 
 STATE_CONFIG_PATH = Path(__file__).resolve().parent.parent / "state_config.txt"
 
@@ -12,6 +15,13 @@ DEFAULT_STATES = [
 ]
 
 
+class StateConfig(NamedTuple):
+    states: Tuple[Tuple[str, str], ...]
+    names: Mapping[str, str]
+    colors: Mapping[str, str]
+    order: Mapping[str, int]
+
+
 def _ensure_config_exists() -> None:
     if STATE_CONFIG_PATH.exists():
         return
@@ -19,11 +29,9 @@ def _ensure_config_exists() -> None:
     STATE_CONFIG_PATH.write_text("\n".join(lines), encoding="utf-8")
 
 
-def load_states() -> List[Dict[str, str]]:
-    _ensure_config_exists()
-    states: List[Dict[str, str]] = []
-    raw = STATE_CONFIG_PATH.read_text(encoding="utf-8").splitlines()
-    for line in raw:
+def _parse_states(raw_text: str) -> StateConfig:
+    states: List[Tuple[str, str]] = []
+    for line in raw_text.splitlines():
         line = line.strip()
         if not line or line.startswith("#"):
             continue
@@ -32,25 +40,40 @@ def load_states() -> List[Dict[str, str]]:
             continue
         name = parts[0]
         color = parts[1] if len(parts) > 1 and parts[1] else "#777777"
-        states.append({"name": name, "color": color})
-    if states:
-        return states
-    return [{"name": name, "color": color} for name, color in DEFAULT_STATES]
+        states.append((name, color))
+    if not states:
+        states = list(DEFAULT_STATES)
+    names: Dict[str, str] = {}
+    for name, _ in states:
+        names.setdefault(name.lower(), name)
+    return StateConfig(
+        states=tuple(states),
+        names=MappingProxyType(names),
+        colors=MappingProxyType({name.lower(): color for name, color in states}),
+        order=MappingProxyType({name.lower(): idx for idx, (name, _) in enumerate(states)}),
+    )
+
+
+_config = register_config("stati", CachedConfig(STATE_CONFIG_PATH, _parse_states, _ensure_config_exists))
+
+
+def load_states() -> List[Dict[str, str]]:
+    return [{"name": name, "color": color} for name, color in _config.get().states]
 
 
 def resolve_state(state_name: str | None) -> str:
     if not state_name:
         return DEFAULT_STATES[0][0]
-    name = state_name.strip().lower()
-    for entry in load_states():
-        if entry["name"].lower() == name:
-            return entry["name"]
-    return DEFAULT_STATES[0][0]
+    return _config.get().names.get(state_name.strip().lower(), DEFAULT_STATES[0][0])
+
+
+def state_color_map() -> Mapping[str, str]:
+    return _config.get().colors
 
 
-def state_color_map() -> Dict[str, str]:
-    return {entry["name"].lower(): entry["color"] for entry in load_states()}
+def state_order_map() -> Mapping[str, int]:
+    return _config.get().order
 
 
-def state_order_map() -> Dict[str, int]:
-    return {entry["name"].lower(): idx for idx, entry in enumerate(load_states())}
+def states_digest() -> str:
+    return _config.digest
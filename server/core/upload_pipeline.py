@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .blob_store import TEMP_DIR, blob_path
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# limiti in MiB: singolo file e somma dei file di una richiesta
+MAX_FILE_BYTES = int(os.environ.get("PLM_UPLOAD_MAX_FILE_MB", 1024)) * 1024 * 1024
+MAX_REQUEST_BYTES = int(os.environ.get("PLM_UPLOAD_MAX_REQUEST_MB", 2048)) * 1024 * 1024
+# margine per intestazioni e separatori multipart oltre ai byte dei file
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StagedFile(NamedTuple):
+    filename: str
+    content_type: str
+    temp_path: Path
+    final_path: Path
+    size: int
+    sha256: str
+
+
+# blob spostati da richieste non ancora confermate (sha256 -> numero di richieste): un blob
+# creato da una richiesta fallita si elimina solo se nessun'altra lo sta usando
+_pending_blobs: Dict[str, int] = {}
+
+
+class StagedUploads:
+    """
+    File di una richiesta scritti a blocchi in temporanei del blob store, con SHA-256 e
+    dimensione calcolati durante la copia. Prima del commit delle righe che li referenziano
+    `promote()` li rinomina nel blob del loro hash (atomico sullo stesso filesystem; se il
+    contenuto c'è già il temporaneo viene scartato); dopo il commit riuscito si chiama
+    `release()`. In caso di errore `discard(db)` elimina i temporanei e i blob creati dalla
+    richiesta che nessuna riga confermata referenzia.
+    """
+
+    def __init__(self, max_file_bytes: int = MAX_FILE_BYTES, max_request_bytes: int = MAX_REQUEST_BYTES):
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.files: List[StagedFile] = []
+        self.total = 0
+        self._held: List[str] = []
+        self._created: List[StagedFile] = []
+
+    async def add(self, upload: UploadFile) -> StagedFile:
+        return await self.add_stream(upload.filename, upload.content_type, _read_upload(upload))
+
+    async def add_stream(self, filename: str, content_type: str, chunks: AsyncIterator[bytes]) -> StagedFile:
+        await aiofiles.os.makedirs(TEMP_DIR, exist_ok=True)
+        temp_path = TEMP_DIR / f"{uuid.uuid4().hex}.part"
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(temp_path, "wb") as out:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        raise UploadTooLarge(
+                            f"{filename}: supera il limite di {self.max_file_bytes // (1024 * 1024)} MB per file"
+                        )
+                    if self.total + size > self.max_request_bytes:
+                        raise UploadTooLarge(
+                            f"Richiesta oltre il limite di {self.max_request_bytes // (1024 * 1024)} MB"
+                        )
+                    hasher.update(chunk)
+                    await out.write(chunk)
+        except BaseException:
+            await _remove(temp_path)
+            raise
+        self.total += size
+        sha256 = hasher.hexdigest()
+        staged = StagedFile(
+            filename=filename,
+            content_type=content_type or "",
+            temp_path=temp_path,
+            final_path=blob_path(sha256),
+            size=size,
+            sha256=sha256,
+        )
+        self.files.append(staged)
+        return staged
+
+    async def promote(self) -> None:
+        for staged in self.files:
+            _pending_blobs[staged.sha256] = _pending_blobs.get(staged.sha256, 0) + 1
+            self._held.append(staged.sha256)
+            try:
+                if await aiofiles.os.path.exists(staged.final_path):
+                    await _remove(staged.temp_path)
+                    continue
+                await aiofiles.os.makedirs(staged.final_path.parent, exist_ok=True)
+                await aiofiles.os.replace(staged.temp_path, staged.final_path)
+            except OSError:
+                logger.exception("Impossibile spostare %s in %s", staged.temp_path, staged.final_path)
+                raise
+            self._created.append(staged)
+        self.files = []
+
+    def release(self) -> None:
+        for sha256 in self._held:
+            _pending_blobs[sha256] -= 1
+            if not _pending_blobs[sha256]:
+                del _pending_blobs[sha256]
+        self._held = []
+        self._created = []
+
+    async def discard(self, db: Optional[AsyncSession] = None) -> None:
+        for staged in self.files:
+            await _remove(staged.temp_path)
+        self.files = []
+        created = self._created
+        self.release()
+        if not created:
+            return
+        if db is None:
+            # senza sessione non si può verificare: ci pensa la pulizia all'avvio
+            return
+        await db.rollback()
+        for staged in created:
+            if staged.sha256 in _pending_blobs:
+                continue
+            referenziato = await db.scalar(
+                select(models.Blob.sha256).where(
+                    models.Blob.sha256 == staged.sha256, models.Blob.riferimenti > 0
+                )
+            )
+            if referenziato is None:
+                await _remove(staged.final_path)
+
+
+async def _read_upload(upload: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(CHUNK_SIZE):
+        yield chunk
+
+
+async def _remove(path: Path) -> None:
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class RequestSizeLimit:
+    """
+    Middleware ASGI: rifiuta con 413 le richieste multipart oltre MAX_REQUEST_BYTES prima che
+    Starlette ne scriva le parti su disco, dal Content-Length dichiarato o, se manca (chunked),
+    contando i byte ricevuti.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES + MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {name.lower(): value for name, value in scope["headers"]}
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/"):
+            await self.app(scope, receive, send)
+            return
+        try:
+            content_length = int(headers.get(b"content-length", b""))
+        except ValueError:
+            content_length = None
+        if content_length is not None and content_length > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if too_large:
+                # FastAPI trasforma l'errore di lettura del corpo in un 400: risponde 413 al suo posto
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self._reject(send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps(
+            {"detail": f"Richiesta oltre il limite di {MAX_REQUEST_BYTES // (1024 * 1024)} MB"}
+        ).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
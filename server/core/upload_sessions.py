@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import math
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, List
+
+import aiofiles
+import aiofiles.os
+from sqlalchemy import delete
+
+from . import models
+from .blob_store import TEMP_DIR
+
+logger = logging.getLogger(__name__)
+
+SESSION_DIR = TEMP_DIR / "sessioni"
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# sessioni senza blocchi ricevuti da più di N ore vengono eliminate
+SESSION_TTL_HOURS = float(os.environ.get("PLM_UPLOAD_SESSION_TTL_HOURS", 24))
+
+_CHUNK_SUFFIX = ".chunk"
+
+
+class ChunkRejected(Exception):
+    pass
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def chunk_count(sessione: models.UploadSessione) -> int:
+    return max(1, math.ceil(sessione.dimensione / sessione.chunk_size))
+
+
+def expected_chunk_size(sessione: models.UploadSessione, numero: int) -> int:
+    if numero < chunk_count(sessione) - 1:
+        return sessione.chunk_size
+    return sessione.dimensione - sessione.chunk_size * (chunk_count(sessione) - 1)
+
+
+def session_dir(session_id: str) -> Path:
+    return SESSION_DIR / session_id
+
+
+def _chunk_path(session_id: str, numero: int) -> Path:
+    return session_dir(session_id) / f"{numero}{_CHUNK_SUFFIX}"
+
+
+async def write_chunk(
+    sessione: models.UploadSessione, numero: int, body: AsyncIterator[bytes], sha256: str
+) -> None:
+    """Scrive un blocco in un temporaneo e lo rende visibile (rename) solo se dimensione e hash tornano."""
+    if not 0 <= numero < chunk_count(sessione):
+        raise ChunkRejected(f"Blocco {numero} fuori intervallo")
+    atteso = expected_chunk_size(sessione, numero)
+    directory = session_dir(sessione.id)
+    await aiofiles.os.makedirs(directory, exist_ok=True)
+    temp_path = directory / f"{numero}.{uuid.uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            async for data in body:
+                size += len(data)
+                if size > atteso:
+                    raise ChunkRejected(f"Blocco {numero} più grande del previsto ({atteso} byte)")
+                hasher.update(data)
+                await out.write(data)
+        if size != atteso:
+            raise ChunkRejected(f"Blocco {numero}: ricevuti {size} byte su {atteso}")
+        if hasher.hexdigest() != sha256.strip().lower():
+            raise ChunkRejected(f"Blocco {numero}: checksum non corrispondente")
+        await aiofiles.os.replace(temp_path, _chunk_path(sessione.id, numero))
+    except BaseException:
+        try:
+            await aiofiles.os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+async def missing_chunks(sessione: models.UploadSessione) -> List[int]:
+    try:
+        names = await aiofiles.os.listdir(session_dir(sessione.id))
+    except FileNotFoundError:
+        names = []
+    ricevuti = {
+        int(name[: -len(_CHUNK_SUFFIX)])
+        for name in names
+        if name.endswith(_CHUNK_SUFFIX) and name[: -len(_CHUNK_SUFFIX)].isdigit()
+    }
+    return [numero for numero in range(chunk_count(sessione)) if numero not in ricevuti]
+
+
+async def read_assembled(sessione: models.UploadSessione, block_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Contenuto completo letto blocco per blocco (nessun file intermedio in memoria)."""
+    for numero in range(chunk_count(sessione)):
+        async with aiofiles.open(_chunk_path(sessione.id, numero), "rb") as source:
+            while data := await source.read(block_size):
+                yield data
+
+
+def remove_session_files(session_id: str) -> None:
+    shutil.rmtree(session_dir(session_id), ignore_errors=True)
+
+
+def purge_expired_sessions(connection) -> int:
+    """Elimina le sessioni abbandonate (metadati e blocchi già ricevuti)."""
+    table = models.UploadSessione.__table__
+    limite = datetime.now(timezone.utc) - timedelta(hours=SESSION_TTL_HOURS)
+    scadute = connection.execute(
+        delete(table).where(table.c.updated_at < limite).returning(table.c.id)
+    ).scalars().all()
+    for session_id in scadute:
+        remove_session_files(session_id)
+    if scadute:
+        logger.info("Eliminate %d sessioni di caricamento abbandonate", len(scadute))
+    return len(scadute)
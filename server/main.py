@@ -1,19 +1,51 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from core import models, database
-from core.schema_utils import ensure_schema
-from routers import codici, files, distinte, revisioni, stati, form, auth
+from core import database
+from core.schema_utils import run_migrations
+from core.change_tracking import install_change_tracking
+from core.blob_store import (
+    install_blob_refcounts,
+    purge_orphan_temp_files,
+    purge_unreferenced_blobs,
+    purge_untracked_blob_files,
+)
+from core.account_registry import import_accounts_csv
+from core.password_utils import shutdown_hash_pool
+from core.activity_logger import flush_activity_log
+from core.upload_pipeline import RequestSizeLimit
+from core.upload_sessions import purge_expired_sessions
+from routers import codici, files, distinte, revisioni, stati, form, auth, modifiche, configurazione, attivita, uploads
+
+
+# ✅ Crea/aggiorna lo schema (nessuna introspezione se la versione registrata è già aggiornata)
+run_migrations()
+install_change_tracking(database.SessionLocal)
+install_blob_refcounts()
+purge_unreferenced_blobs(database.engine)
+purge_untracked_blob_files(database.engine)
+purge_orphan_temp_files()
+with database.engine.begin() as _connection:
+    purge_expired_sessions(_connection)
+import_accounts_csv()
+
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    yield
+    # ✅ Chiusura ordinata dei pool di lavoro
+    shutdown_hash_pool()
+    flush_activity_log()
+    await database.async_engine.dispose()
 
-# ✅ Crea tabelle nel database se non esistono
-models.Base.metadata.create_all(bind=database.engine)
-ensure_schema()
 
 # ✅ Inizializza FastAPI
 app = FastAPI(
     title="PLM Server",
     description="Server PLM per gestione codici, magazzino e file tecnici",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # ✅ Abilita CORS (per permettere a client su altre macchine di collegarsi)
@@ -24,6 +56,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# ✅ Rifiuta subito i caricamenti oltre il limite, prima che vengano scritti su disco
+app.add_middleware(RequestSizeLimit)
 
 # ✅ Registra i router
 app.include_router(codici.router)
@@ -33,6 +67,10 @@ app.include_router(revisioni.router)
 app.include_router(stati.router)
 app.include_router(form.router)
 app.include_router(auth.router)
+app.include_router(modifiche.router)
+app.include_router(configurazione.router)
+app.include_router(attivita.router)
+app.include_router(uploads.router)
 
 # ✅ Endpoint di test
 @app.get("/")
@@ -0,0 +1,137 @@
+from datetime import date, datetime, timezone
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from core import models, database
+from core.auth_context import require_account_context
+
+router = APIRouter(prefix="/attivita", tags=["Attività"])
+
+MAX_PAGE_SIZE = 500
+
+
+class AttivitaOut(BaseModel):
+    id: int
+    account: str
+    stabilimento: str
+    gruppo: str
+    azione: str
+    riferimento: Optional[str] = None
+    dettagli: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+class AttivitaPage(BaseModel):
+    items: List[AttivitaOut]
+    next_cursor: Optional[int] = None
+
+
+class ConteggioAttivita(BaseModel):
+    giorno: Optional[str] = None
+    account: Optional[str] = None
+    conteggio: int
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # created_at è salvato in UTC senza fuso: un parametro con offset (…Z, +02:00) va convertito
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    # limite superiore esclusivo: l'intervallo [prefix, bound) usa l'indice su riferimento
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+@router.get("", response_model=AttivitaPage)
+def elenco_attivita(
+    account: Optional[str] = Query(None),
+    stabilimento: Optional[str] = Query(None),
+    gruppo: Optional[str] = Query(None),
+    azione: Optional[str] = Query(None),
+    riferimento: Optional[str] = Query(None, description="Prefisso del riferimento"),
+    dal: Optional[datetime] = Query(None),
+    al: Optional[datetime] = Query(None),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(None, ge=1, description="`next_cursor` della pagina precedente"),
+    db: Session = Depends(database.get_read_db),
+    account_ctx: dict = Depends(require_account_context),
+):
+    """
+    Registro attività dal più recente, filtrabile; paginazione keyset su id.
+    """
+    log = models.AttivitaLog
+    query = db.query(log)
+    if account:
+        query = query.filter(log.account == account)
+    if stabilimento:
+        query = query.filter(log.stabilimento == stabilimento)
+    if gruppo:
+        query = query.filter(log.gruppo == gruppo)
+    if azione:
+        query = query.filter(log.azione == azione)
+    if riferimento:
+        query = query.filter(
+            log.riferimento >= riferimento,
+            log.riferimento < _prefix_upper_bound(riferimento),
+        )
+    if dal:
+        query = query.filter(log.created_at >= _naive_utc(dal))
+    if al:
+        query = query.filter(log.created_at < _naive_utc(al))
+    if cursor:
+        query = query.filter(log.id < cursor)
+
+    rows = query.order_by(log.id.desc()).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return AttivitaPage(items=rows[:limit], next_cursor=next_cursor)
+
+
+@router.get("/riepilogo", response_model=List[ConteggioAttivita])
+def riepilogo_attivita(
+    raggruppa: Literal["giorno", "account", "giorno_account"] = Query("giorno"),
+    account: Optional[str] = Query(None),
+    stabilimento: Optional[str] = Query(None),
+    gruppo: Optional[str] = Query(None),
+    azione: Optional[str] = Query(None),
+    dal: Optional[date] = Query(None),
+    al: Optional[date] = Query(None),
+    db: Session = Depends(database.get_read_db),
+    account_ctx: dict = Depends(require_account_context),
+):
+    """
+    Conteggi aggregati per giorno e/o account, letti dalla tabella di riepilogo giornaliera.
+    """
+    if dal and al and dal > al:
+        raise HTTPException(status_code=400, detail="Intervallo date non valido")
+
+    rollup = models.AttivitaGiornaliera
+    columns = []
+    if raggruppa in ("giorno", "giorno_account"):
+        columns.append(rollup.giorno)
+    if raggruppa in ("account", "giorno_account"):
+        columns.append(rollup.account)
+
+    query = db.query(*columns, func.sum(rollup.conteggio).label("conteggio"))
+    if account:
+        query = query.filter(rollup.account == account)
+    if stabilimento:
+        query = query.filter(rollup.stabilimento == stabilimento)
+    if gruppo:
+        query = query.filter(rollup.gruppo == gruppo)
+    if azione:
+        query = query.filter(rollup.azione == azione)
+    if dal:
+        query = query.filter(rollup.giorno >= dal.isoformat())
+    if al:
+        query = query.filter(rollup.giorno <= al.isoformat())
+
+    rows = query.group_by(*columns).order_by(*columns).all()
+    return [ConteggioAttivita(**row._asdict()) for row in rows]
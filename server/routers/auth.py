@@ -1,13 +1,27 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from core import models, database
-from core.account_registry import account_hierarchy, find_account, create_account
+from core.account_registry import (
+    account_hierarchy,
+    accounts_version,
+    create_account,
+    find_account,
+    invalidate_account_cache,
+)
+from core.http_cache import etag_matches, make_etag, not_modified
+from core.session_tokens import issue_tokens, verify_token
 from core.password_policy import load_policy, validate_password
-from core.password_utils import hash_password, verify_password
+from core.password_utils import (
+    HashPoolBusy,
+    hash_password_async,
+    hash_pool_stats,
+    verify_and_update_async,
+)
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
@@ -42,13 +56,23 @@ class AccountInfo(BaseModel):
     account: str
 
 
+class LoginResponse(AccountInfo):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_at: int
+
+
+class RefreshPayload(BaseModel):
+    refresh_token: str
+
+
 class AccountCreatePayload(BaseModel):
     account: str
     password: str
 
 
-def _upsert_password(db: Session, account: str, password: str) -> None:
-    hashed = hash_password(password)
+def _upsert_password(db: Session, account: str, hashed: str) -> None:
     cred = db.query(models.AccountCredential).filter(models.AccountCredential.account == account).first()
     if cred:
         cred.password_hash = hashed
@@ -62,8 +86,17 @@ def _get_credential(db: Session, account: str) -> models.AccountCredential | Non
     return db.query(models.AccountCredential).filter(models.AccountCredential.account == account).first()
 
 
+def _rehash_password(account: str, hashed: str) -> None:
+    with database.SessionLocal() as db:
+        _upsert_password(db, account, hashed)
+
+
 @router.get("/accounts", response_model=List[HierarchyNode])
-def lista_account():
+def lista_account(request: Request, response: Response):
+    etag = make_etag("accounts", accounts_version())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return account_hierarchy()
 
 
@@ -73,25 +106,73 @@ def password_policy():
     return PasswordPolicyResponse(**policy)
 
 
-@router.post("/login", response_model=AccountInfo)
-def login_account(payload: LoginPayload, db: Session = Depends(database.get_db)):
-    info = find_account(payload.account, payload.stabilimento, payload.gruppo)
+def _hash_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Troppi accessi contemporanei, riprova fra qualche secondo",
+        headers={"Retry-After": "2"},
+    )
+
+
+@router.post("/login", response_model=LoginResponse)
+async def login_account(payload: LoginPayload, db: Session = Depends(database.get_read_db)):
+    # bcrypt gira nel pool dedicato (password_utils): l'attesa non occupa il threadpool delle altre richieste
+    # né la connessione di scrittura, usata solo per l'eventuale rehash
+    info = await run_in_threadpool(find_account, payload.account, payload.stabilimento, payload.gruppo)
     if not info:
         raise HTTPException(status_code=404, detail="Account non trovato")
-    cred = _get_credential(db, payload.account)
-    if not cred or not verify_password(payload.password, cred.password_hash):
+    cred = await run_in_threadpool(_get_credential, db, info["account"])
+    if not cred:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Password non valida")
+    try:
+        valid, new_hash = await verify_and_update_async(payload.password, cred.password_hash)
+    except HashPoolBusy:
+        raise _hash_pool_busy()
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Password non valida")
+    if new_hash:
+        # costo bcrypt cambiato: aggiorna l'hash in modo trasparente
+        await run_in_threadpool(_rehash_password, info["account"], new_hash)
+    return LoginResponse(**info, **issue_tokens(info))
+
+
+@router.get("/metrics/hash")
+def hash_metrics():
+    """Statistiche del pool di hashing (attesa in coda in millisecondi)."""
+    return hash_pool_stats()
+
+
+@router.post("/refresh", response_model=LoginResponse)
+def refresh_session(payload: RefreshPayload):
+    """Rinnova i token senza password (nessuna verifica bcrypt): usato dall'auto-login dei client."""
+    context = verify_token(payload.refresh_token, kind="refresh")
+    if not context:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Sessione scaduta o non valida")
+    info = find_account(context["account"], context["stabilimento"], context["gruppo"])
+    if not info:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Account non più valido")
+    return LoginResponse(**info, **issue_tokens(info))
+
+
+def _create_account_with_password(db: Session, account: str, hashed: str):
+    info = create_account(db, account)
+    # account e password nella stessa transazione
+    _upsert_password(db, info["account"], hashed)
     return info
 
 
 @router.post("/accounts", response_model=AccountInfo, status_code=201)
-def crea_account(payload: AccountCreatePayload, db: Session = Depends(database.get_db)):
+async def crea_account(payload: AccountCreatePayload, db: Session = Depends(database.get_db)):
     errors = validate_password(payload.password)
     if errors:
         raise HTTPException(status_code=400, detail=" ".join(errors))
     try:
-        info = create_account(payload.account)
+        hashed = await hash_password_async(payload.password)
+    except HashPoolBusy:
+        raise _hash_pool_busy()
+    try:
+        info = await run_in_threadpool(_create_account_with_password, db, payload.account, hashed)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
-    _upsert_password(db, info["account"], payload.password)
+    await run_in_threadpool(invalidate_account_cache)
     return info
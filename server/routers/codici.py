@@ -1,16 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.exc import IntegrityError
 from core import models, database
-from core.state_manager import resolve_state, state_color_map
+from core.state_manager import resolve_state, state_color_map, states_digest
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Callable, List, Optional, Union
 from datetime import datetime
+import base64
+import binascii
+import json
 from core.auth_context import require_account_context
 from core.activity_logger import log_activity
+from core.code_allocator import allocate_progressive, MAX_PROGRESSIVE
+from core.search_index import FTS_TABLE, build_match_query
+from core.change_tracking import catalog_version
+from core.http_cache import etag_matches, make_etag, not_modified
 
 router = APIRouter(prefix="/codici", tags=["Codici"])
 
+MAX_PAGE_SIZE = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = (
+    models.Codice.codice,
+    models.Codice.descrizione,
+    models.Codice.quantita,
+    models.Codice.ubicazione,
+)
+MAX_SEARCH_RESULTS = 100
+MAX_BATCH_DETAILS = 1000
+DETAIL_CHUNK_SIZE = 500
+SORT_COLUMNS = {
+    "codice": models.Codice.codice,
+    "descrizione": func.coalesce(models.Codice.descrizione, ""),
+    "quantita": func.coalesce(models.Codice.quantita, 0.0),
+    "ubicazione": func.coalesce(models.Codice.ubicazione, ""),
+}
+
 # Schema Pydantic per input/output
 class CodiceBase(BaseModel):
     codice: str
@@ -21,6 +51,11 @@ class CodiceBase(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class CodicePage(BaseModel):
+    items: List[CodiceBase]
+    next_cursor: Optional[str] = None
+
+
 class CodiceCreate(CodiceBase):
     stato: Optional[str] = None
     rilascia_subito: bool = False
@@ -60,6 +95,16 @@ class CodiceDetail(CodiceBase):
     files: List[FileInfo]
 
 
+class DettagliRequest(BaseModel):
+    codici: List[str]
+    include_unreleased: bool = False
+
+
+class CodiceDetailBatch(BaseModel):
+    dettagli: List[CodiceDetail]
+    mancanti: List[str] = []
+
+
 @router.post("/", response_model=CodiceBase)
 def crea_codice(
     codice: CodiceCreate,
@@ -76,20 +121,11 @@ def crea_codice(
     if len(tipo) != 2 or not tipo.isdigit():
         raise HTTPException(status_code=400, detail="Il tipo deve contenere solo 2 cifre (es. '03')")
 
-    # 🔹 Trova il numero massimo valido in tutti i codici esistenti
-    max_num = 0
-    tutti = db.query(models.Codice).all()
-    for c in tutti:
-        try:
-            if len(c.codice) >= 8 and c.codice[2:8].isdigit():
-                n = int(c.codice[2:8])
-                if n > max_num:
-                    max_num = n
-        except Exception:
-            # ignora codici non validi
-            continue
-
-    numero = max_num + 1
+    # 🔹 Prossimo numero progressivo globale dal contatore dedicato (O(1), atomico)
+    numero = allocate_progressive(db)
+    if numero > MAX_PROGRESSIVE:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Numerazione progressiva dei codici esaurita")
     numero_str = f"{numero:06d}"
 
     # 🔹 Calcola lettera di controllo
@@ -108,8 +144,7 @@ def crea_codice(
     )
 
     db.add(db_codice)
-    db.commit()
-    db.refresh(db_codice)
+    db.flush()
 
     stato = resolve_state(codice.stato)
     revisione = models.Revisione(
@@ -128,45 +163,195 @@ def crea_codice(
     return db_codice
 
 
-@router.get("/", response_model=List[CodiceBase])
-def lista_codici(include_unreleased: bool = False, db: Session = Depends(database.get_db)):
+def _encode_cursor(ordina: str, direzione: str, valore, codice: str) -> str:
+    raw = json.dumps([ordina, direzione, valore, codice], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, ordina: str, direzione: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        c_ordina, c_direzione, valore, codice = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+    if c_ordina != ordina or c_direzione != direzione:
+        raise HTTPException(status_code=400, detail="Cursore non coerente con l'ordinamento richiesto")
+    return valore, codice
+
+
+def _ndjson_response(stmt, headers=None) -> StreamingResponse:
+    """
+    Esporta una riga JSON per codice leggendo a blocchi (yield_per): la memoria resta costante
+    qualunque sia la dimensione del catalogo. La sessione è propria dello stream perché quella
+    della dipendenza get_db viene chiusa prima dell'invio della risposta.
+    """
+    def rows():
+        with database.ReadSessionLocal() as session:
+            result = session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            for partition in result.partitions():
+                yield "".join(
+                    json.dumps(
+                        {"codice": codice, "descrizione": descrizione, "quantita": quantita, "ubicazione": ubicazione},
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                    for codice, descrizione, quantita, ubicazione in partition
+                )
+
+    return StreamingResponse(rows(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/export")
+def esporta_codici(include_unreleased: bool = False):
+    """Catalogo completo in formato NDJSON (una riga per codice), in streaming."""
+    stmt = select(*EXPORT_COLUMNS).order_by(models.Codice.codice)
+    if not include_unreleased:
+        stmt = stmt.where(models.Codice.has_released_revision.is_(True))
+    return _ndjson_response(stmt)
+
+
+@router.get("/", response_model=Union[List[CodiceBase], CodicePage])
+def lista_codici(
+    request: Request,
+    response: Response,
+    include_unreleased: bool = False,
+    codice: Optional[str] = None,
+    descrizione: Optional[str] = None,
+    ubicazione: Optional[str] = None,
+    quantita_min: Optional[float] = None,
+    quantita_max: Optional[float] = None,
+    tipo: Optional[str] = None,
+    stato: Optional[str] = None,
+    rilasciato: Optional[bool] = None,
+    ordina: str = "codice",
+    direzione: str = "asc",
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
+):
+    """
+    Elenco codici con filtri lato server.
+    - Con `limit` e/o `cursor` risponde a pagine (keyset su ordinamento + codice)
+      e restituisce `next_cursor` per la pagina successiva.
+    - Senza `limit` né `cursor` restituisce la lista completa (client esistenti).
+    """
+    if ordina not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Ordinamento non valido: {ordina}")
+    if direzione not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Direzione deve essere 'asc' o 'desc'")
+
+    wants_ndjson = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    etag = make_etag("codici", catalog_version(db), sorted(request.query_params.multi_items()), wants_ndjson)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
     query = db.query(models.Codice)
+    if rilasciato is True or (rilasciato is None and not include_unreleased):
+        query = query.filter(models.Codice.has_released_revision.is_(True))
+    elif rilasciato is False:
+        query = query.filter(models.Codice.has_released_revision.is_(False))
+
+    if codice:
+        query = query.filter(models.Codice.codice.contains(codice.strip(), autoescape=True))
+    if descrizione:
+        query = query.filter(models.Codice.descrizione.contains(descrizione.strip(), autoescape=True))
+    if ubicazione:
+        query = query.filter(models.Codice.ubicazione.contains(ubicazione.strip(), autoescape=True))
+    if quantita_min is not None:
+        query = query.filter(models.Codice.quantita >= quantita_min)
+    if quantita_max is not None:
+        query = query.filter(models.Codice.quantita <= quantita_max)
+    if tipo:
+        query = query.filter(models.Codice.codice.startswith(tipo.strip(), autoescape=True))
+    if stato:
+        query = query.filter(models.Codice.latest_state == stato.strip())
+
+    # ordinamento stabile: a parità di valore decide il codice (unico)
+    sort_cols = [SORT_COLUMNS[ordina]]
+    if ordina != "codice":
+        sort_cols.append(models.Codice.codice)
+    query = query.order_by(*(col.asc() if direzione == "asc" else col.desc() for col in sort_cols))
+
+    if limit is None and cursor is None:
+        if wants_ndjson:
+            return _ndjson_response(query.with_entities(*EXPORT_COLUMNS).statement, headers={"ETag": etag})
+        return query.all()
+
+    if cursor:
+        valore, ultimo_codice = _decode_cursor(cursor, ordina, direzione)
+        if ordina == "codice":
+            keyset, bound = models.Codice.codice, ultimo_codice
+        else:
+            keyset, bound = tuple_(*sort_cols), tuple_(valore, ultimo_codice)
+        query = query.filter(keyset > bound if direzione == "asc" else keyset < bound)
+
+    page_size = limit or MAX_PAGE_SIZE
+    rows = query.limit(page_size + 1).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        last_value = getattr(last, ordina)
+        if last_value is None:
+            last_value = 0.0 if ordina == "quantita" else ""
+        next_cursor = _encode_cursor(ordina, direzione, last_value, last.codice)
+    return CodicePage(items=rows, next_cursor=next_cursor)
+
+
+@router.get("/search", response_model=List[CodiceBase])
+async def cerca_codici(
+    q: str,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    include_unreleased: bool = False,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Ricerca full-text (indice FTS5) su codice, descrizione e ubicazione.
+    Parole -> prefisso, "frase fra virgolette" -> frase esatta; risultati ordinati per rilevanza.
+    """
+    match = build_match_query(q)
+    if not match:
+        return []
+    released_clause = ""
     if not include_unreleased:
-        query = query.join(models.Revisione).filter(models.Revisione.is_released.is_(True)).distinct()
-    return query.all()
+        released_clause = "AND codici.has_released_revision = 1"
+    stmt = text(
+        f"""
+        SELECT codici.* FROM {FTS_TABLE}
+        JOIN codici ON codici.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :match {released_clause}
+        ORDER BY {FTS_TABLE}.rank
+        LIMIT :limit
+        """
+    )
+    result = await db.scalars(
+        select(models.Codice).from_statement(stmt.bindparams(match=match, limit=limit))
+    )
+    return result.all()
 
 
 @router.get("/{codice}", response_model=CodiceBase)
-def leggi_codice(codice: str, include_unreleased: bool = False, db: Session = Depends(database.get_db)):
+def leggi_codice(codice: str, include_unreleased: bool = False, db: Session = Depends(database.get_read_db)):
     db_codice = db.query(models.Codice).filter(models.Codice.codice == codice).first()
     if not db_codice:
         raise HTTPException(status_code=404, detail="Codice non trovato")
-    if not include_unreleased:
-        released = any(rev.is_released for rev in db_codice.revisioni)
-        if not released:
-            raise HTTPException(status_code=404, detail="Codice non rilasciato")
+    if not include_unreleased and not db_codice.has_released_revision:
+        raise HTTPException(status_code=404, detail="Codice non rilasciato")
     return db_codice
 
 
-@router.get("/{codice}/dettaglio", response_model=CodiceDetail)
-def dettaglio_codice(codice: str, include_unreleased: bool = False, db: Session = Depends(database.get_db)):
-    codice_obj = db.query(models.Codice).filter(models.Codice.codice == codice).first()
-    if not codice_obj:
-        raise HTTPException(status_code=404, detail="Codice non trovato")
-
-    if not codice_obj.revisioni:
-        default_state = resolve_state(None)
-        db_rev = models.Revisione(codice_id=codice_obj.id, indice=0, stato=default_state)
-        db.add(db_rev)
-        db.commit()
-        db.refresh(codice_obj)
-    elif not include_unreleased:
-        has_release = any(rev.is_released for rev in codice_obj.revisioni)
-        if not has_release:
-            raise HTTPException(status_code=404, detail="Codice non rilasciato")
+def _detail_options():
+    # numero fisso di query (codice, revisioni, certificazioni, file revisione, file codice)
+    # indipendente dal numero di revisioni: niente lazy load durante la serializzazione
+    return (
+        selectinload(models.Codice.revisioni).selectinload(models.Revisione.certificazione),
+        selectinload(models.Codice.revisioni).selectinload(models.Revisione.files),
+        selectinload(models.Codice.files),
+    )
 
-    color_map = state_color_map()
 
+def _detail_payload(codice_obj: models.Codice, color_map: dict) -> CodiceDetail:
     revisioni = [
         RevisioneOut(
             indice=rev.indice,
@@ -208,3 +393,110 @@ def dettaglio_codice(codice: str, include_unreleased: bool = False, db: Session
         revisioni=revisioni,
         files=files,
     )
+
+
+async def _json_in_threadpool(build: Callable[[], BaseModel], headers=None) -> Response:
+    """
+    Payload costruito e serializzato nel threadpool: con molte revisioni è lavoro di CPU che
+    sull'event loop fermerebbe le altre richieste (le query restano asincrone).
+    """
+    content = await run_in_threadpool(lambda: build().model_dump_json())
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+async def _load_details(db: AsyncSession, codici: List[str]) -> List[models.Codice]:
+    """Carica più codici con le query IN, a blocchi entro il limite di parametri di SQLite."""
+    loaded: List[models.Codice] = []
+    for start in range(0, len(codici), DETAIL_CHUNK_SIZE):
+        chunk = codici[start:start + DETAIL_CHUNK_SIZE]
+        result = await db.scalars(
+            select(models.Codice).options(*_detail_options()).where(models.Codice.codice.in_(chunk))
+        )
+        loaded.extend(result.all())
+    return loaded
+
+
+def _ensure_default_revisions(codice_ids: List[int]) -> None:
+    """Crea la rev0 dei codici che non hanno revisioni, in una transazione breve sulla connessione di scrittura."""
+    default_state = resolve_state(None)
+    with database.SessionLocal() as writer:
+        con_revisioni = set(
+            writer.scalars(
+                select(models.Revisione.codice_id).where(models.Revisione.codice_id.in_(codice_ids))
+            )
+        )
+        for codice_id in codice_ids:
+            if codice_id not in con_revisioni:
+                writer.add(models.Revisione(codice_id=codice_id, indice=0, stato=default_state))
+        try:
+            writer.commit()
+        except IntegrityError:
+            # creata nel frattempo da una richiesta concorrente (indice unico per codice)
+            writer.rollback()
+
+
+@router.post("/dettagli", response_model=CodiceDetailBatch)
+async def dettagli_codici(payload: DettagliRequest, db: AsyncSession = Depends(database.get_async_db)):
+    richiesti = list(dict.fromkeys(c.strip() for c in payload.codici if c and c.strip()))
+    if len(richiesti) > MAX_BATCH_DETAILS:
+        raise HTTPException(status_code=400, detail=f"Massimo {MAX_BATCH_DETAILS} codici per richiesta")
+
+    trovati = {obj.codice: obj for obj in await _load_details(db, richiesti)}
+
+    # come nel dettaglio singolo: i codici senza revisioni ricevono la rev0 di default
+    senza_revisioni = [obj.id for obj in trovati.values() if not obj.revisioni]
+    if senza_revisioni:
+        await run_in_threadpool(_ensure_default_revisions, senza_revisioni)
+        # nuova transazione di lettura: vede la rev0 appena creata
+        await db.rollback()
+        db.expunge_all()
+        trovati = {obj.codice: obj for obj in await _load_details(db, richiesti)}
+
+    color_map = state_color_map()
+    inclusi = []
+    mancanti = []
+    for codice in richiesti:
+        obj = trovati.get(codice)
+        if not obj or (not payload.include_unreleased and not obj.has_released_revision):
+            mancanti.append(codice)
+            continue
+        inclusi.append(obj)
+
+    # i codici sono già caricati per intero: la connessione torna subito al pool di lettura, altrimenti
+    # resterebbe occupata per tutta la serializzazione e sotto carico il pool si esaurirebbe (TimeoutError)
+    await db.close()
+
+    def _batch_payload():
+        return CodiceDetailBatch(dettagli=[_detail_payload(obj, color_map) for obj in inclusi], mancanti=mancanti)
+
+    return await _json_in_threadpool(_batch_payload)
+
+
+@router.get("/{codice}/dettaglio", response_model=CodiceDetail)
+async def dettaglio_codice(
+    codice: str,
+    request: Request,
+    include_unreleased: bool = False,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    stmt = select(models.Codice).options(*_detail_options()).where(models.Codice.codice == codice)
+    codice_obj = (await db.scalars(stmt)).first()
+    if not codice_obj:
+        raise HTTPException(status_code=404, detail="Codice non trovato")
+
+    if not codice_obj.revisioni:
+        await run_in_threadpool(_ensure_default_revisions, [codice_obj.id])
+        await db.rollback()
+        db.expunge_all()
+        codice_obj = (await db.scalars(stmt)).one()
+    elif not include_unreleased and not codice_obj.has_released_revision:
+        raise HTTPException(status_code=404, detail="Codice non rilasciato")
+
+    color_map = state_color_map()
+    etag = make_etag("dettaglio", codice_obj.id, codice_obj.versione, states_digest())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # come nel batch: la connessione non resta occupata durante la serializzazione
+    await db.close()
+    return await _json_in_threadpool(lambda: _detail_payload(codice_obj, color_map), headers={"ETag": etag})
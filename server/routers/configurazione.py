@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+
+from core.auth_context import require_account_context
+from core.config_registry import reload_all
+from core.activity_logger import log_activity
+
+router = APIRouter(prefix="/config", tags=["Configurazione"])
+
+
+@router.post("/reload")
+def ricarica_configurazione(account_ctx: dict = Depends(require_account_context)):
+    """Forza la rilettura dei file di configurazione (stati, form); di norma basta modificarli."""
+    digests = reload_all()
+    log_activity(account_ctx, "configurazione_ricaricata", dettagli=", ".join(sorted(digests)))
+    return {"ricaricati": digests}
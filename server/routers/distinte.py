@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from core import models, database
+from core.http_cache import etag_matches, make_etag, not_modified
 
 router = APIRouter(prefix="/distinte", tags=["distinte"])
 
@@ -57,11 +59,24 @@ def aggiungi_componente(padre: str, figlio: str, quantita: float = 1.0, db: Sess
     }
 
 @router.get("/{codice}")
-def get_distinta(codice: str, db: Session = Depends(database.get_db)):
+def get_distinta(codice: str, request: Request, response: Response, db: Session = Depends(database.get_read_db)):
     codice_padre = db.query(models.Codice).filter_by(codice=codice).first()
     if not codice_padre:
         raise HTTPException(status_code=404, detail="Codice non trovato")
 
+    # la distinta mostra anche la descrizione dei figli: le loro versioni entrano nell'ETag
+    # (le versioni crescono soltanto, quindi la somma cambia ad ogni modifica di un figlio)
+    versioni_figli = (
+        db.query(func.coalesce(func.sum(models.Codice.versione), 0))
+        .join(models.Distinta, models.Distinta.figlio_id == models.Codice.id)
+        .filter(models.Distinta.padre_id == codice_padre.id)
+        .scalar()
+    )
+    etag = make_etag("distinta", codice_padre.id, codice_padre.versione, versioni_figli)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
     distinte = db.query(models.Distinta).filter_by(padre_id=codice_padre.id).all()
     return [
         {
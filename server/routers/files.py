@@ -1,59 +1,103 @@
-from fastapi import APIRouter, UploadFile, Form, HTTPException, Depends
+from typing import Optional
+
+from fastapi import APIRouter, UploadFile, Form, HTTPException, Depends, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from core import models, database
 from core.auth_context import require_account_context
 from core.activity_logger import log_activity
-import os, shutil
+from core.http_cache import file_download
+from core.upload_pipeline import StagedFile, StagedUploads, UploadTooLarge
 
 router = APIRouter(prefix="/files", tags=["Files"])
 
-UPLOAD_DIR = "uploaded_files"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+def _insert_file(db: Session, codice_id: int, filename: str, filetype: str, item: StagedFile) -> int:
+    new_file = models.FileModel(
+        codice_id=codice_id,
+        filename=filename,
+        filepath=str(item.final_path),
+        filetype=filetype or "",
+        dimensione=item.size,
+        sha256=item.sha256,
+    )
+    db.add(new_file)
+    db.commit()
+    return new_file.id
+
 
 @router.post("/upload")
 async def upload_file(
     codice: str = Form(...),
     descrizione: str = Form(""),
     file: UploadFile = None,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     account_ctx: dict = Depends(require_account_context),
 ):
     # verifica codice esistente
-    codice_obj = db.query(models.Codice).filter(models.Codice.codice == codice).first()
-    if not codice_obj:
+    codice_id = await db.scalar(select(models.Codice.id).where(models.Codice.codice == codice))
+    if codice_id is None:
         raise HTTPException(status_code=404, detail=f"Codice {codice} non trovato")
+    # libera la connessione durante la copia
+    await db.commit()
 
-    # salva file
-    save_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(save_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # registra nel DB
-    new_file = models.FileModel(
-        codice_id=codice_obj.id,
-        filename=file.filename,
-        filepath=save_path,
-        filetype=file.content_type or "",
-    )
-    db.add(new_file)
-    db.commit()
-    db.refresh(new_file)
+    # salva file a blocchi in un temporaneo, spostato nel blob store prima di creare la riga
+    staged = StagedUploads()
+    try:
+        item = await staged.add(file)
+        await staged.promote()
+        file_id = await database.run_write(_insert_file, codice_id, file.filename, file.content_type, item)
+        staged.release()
+    except UploadTooLarge as exc:
+        await staged.discard(db)
+        raise HTTPException(status_code=413, detail=str(exc))
+    except BaseException:
+        await staged.discard(db)
+        raise
 
     log_activity(account_ctx, "codice_file_caricato", riferimento=codice, dettagli=file.filename)
     return {
         "codice": codice,
         "file": file.filename,
-        "path": save_path,
-        "id": new_file.id,
+        "path": str(item.final_path),
+        "id": file_id,
     }
 
 @router.get("/{codice}")
-def list_files(codice: str, db: Session = Depends(database.get_db)):
+def list_files(codice: str, db: Session = Depends(database.get_read_db)):
     codice_obj = db.query(models.Codice).filter(models.Codice.codice == codice).first()
     if not codice_obj:
         raise HTTPException(status_code=404, detail="Codice non trovato")
 
     return [
-        {"filename": f.filename, "uploaded_at": f.uploaded_at, "filetype": f.filetype}
+        {
+            "id": f.id,
+            "filename": f.filename,
+            "uploaded_at": f.uploaded_at,
+            "filetype": f.filetype,
+            "size": f.dimensione,
+            "sha256": f.sha256,
+        }
         for f in codice_obj.files
     ]
+
+
+@router.api_route("/download/{codice}", methods=["GET", "HEAD"])
+def download_file(
+    codice: str,
+    request: Request,
+    filename: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
+):
+    """Ultimo file caricato per il codice (o l'ultimo con quel nome); supporta Range per riprendere."""
+    query = (
+        db.query(models.FileModel)
+        .join(models.Codice)
+        .filter(models.Codice.codice == codice)
+    )
+    if filename:
+        query = query.filter(models.FileModel.filename == filename)
+    file_obj = query.order_by(models.FileModel.id.desc()).first()
+    if not file_obj:
+        raise HTTPException(status_code=404, detail="File non trovato")
+    return file_download(request, file_obj.filepath, file_obj.filename, file_obj.sha256, file_obj.filetype)
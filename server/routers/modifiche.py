@@ -0,0 +1,57 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from core import models, database
+
+router = APIRouter(prefix="/changes", tags=["Modifiche"])
+
+MAX_CHANGES = 5000
+
+
+class ModificaOut(BaseModel):
+    id: int
+    entita: str
+    operazione: str
+    entita_id: Optional[int] = None
+    codice: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+class ModifichePage(BaseModel):
+    changes: List[ModificaOut]
+    cursor: int
+    has_more: bool
+
+
+@router.get("", response_model=ModifichePage)
+def elenco_modifiche(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(1000, ge=1, le=MAX_CHANGES),
+    db: Session = Depends(database.get_read_db),
+):
+    """
+    Modifiche successive al cursore `since` (id dell'ultima modifica applicata dal client).
+    Senza `since` restituisce solo il cursore corrente, da usare dopo un download completo.
+    """
+    if since is None:
+        head = db.query(func.max(models.RegistroModifica.id)).scalar() or 0
+        return ModifichePage(changes=[], cursor=head, has_more=False)
+
+    rows = (
+        db.query(models.RegistroModifica)
+        .filter(models.RegistroModifica.id > since)
+        .order_by(models.RegistroModifica.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1].id if rows else since
+    return ModifichePage(changes=rows, cursor=cursor, has_more=has_more)
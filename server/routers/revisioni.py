@@ -1,21 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, select
 from pydantic import BaseModel
-from typing import List, Optional
-from pathlib import Path
-import shutil
-import uuid
+from typing import List, Optional, Tuple
 
 from core import models, database
-from core.state_manager import resolve_state, state_color_map, state_order_map
+from core.state_manager import resolve_state, state_color_map, state_order_map, states_digest
 from core.form_manager import load_form_fields
 from core.auth_context import require_account_context
 from core.activity_logger import log_activity
+from core.http_cache import etag_matches, file_download, make_etag, not_modified
+from core.upload_pipeline import StagedFile, StagedUploads, UploadTooLarge
 
 router = APIRouter(prefix="/revisioni", tags=["Revisioni"])
-REV_FILES_DIR = Path("uploaded_files") / "revisioni"
-REV_FILES_DIR.mkdir(parents=True, exist_ok=True)
 
 
 class RevisioneCreate(BaseModel):
@@ -26,9 +24,12 @@ class RevisioneCreate(BaseModel):
 
 
 class RevisioneFilePayload(BaseModel):
+    id: int
     filename: str
     mimetype: Optional[str] = None
     uploaded_at: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
 
 
 class RevisioneResponse(BaseModel):
@@ -109,12 +110,21 @@ def crea_revisione(
 
 
 @router.get("/{codice}", response_model=List[RevisioneResponse])
-def elenco_revisioni(codice: str, db: Session = Depends(database.get_db)):
-    codice_obj = db.query(models.Codice).filter_by(codice=codice).first()
+def elenco_revisioni(codice: str, request: Request, response: Response, db: Session = Depends(database.get_read_db)):
+    codice_obj = (
+        db.query(models.Codice)
+        .options(selectinload(models.Codice.revisioni).selectinload(models.Revisione.files))
+        .filter_by(codice=codice)
+        .first()
+    )
     if not codice_obj:
         raise HTTPException(status_code=404, detail="Codice non trovato")
 
     color_map = state_color_map()
+    etag = make_etag("revisioni", codice_obj.id, codice_obj.versione, states_digest())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return [
         RevisioneResponse(
             indice=rev.indice,
@@ -144,9 +154,12 @@ def _get_revision_or_404(db: Session, codice: str, indice: int) -> models.Revisi
 def _files_payload(revisione: models.Revisione) -> List[RevisioneFilePayload]:
     return [
         RevisioneFilePayload(
+            id=rf.id,
             filename=rf.filename,
             mimetype=rf.mimetype,
             uploaded_at=rf.uploaded_at.isoformat() if rf.uploaded_at else None,
+            size=rf.dimensione,
+            sha256=rf.sha256,
         )
         for rf in revisione.files
     ]
@@ -174,24 +187,15 @@ def _clone_certificazione_from_previous(db: Session, codice_id: int, nuova_revis
         nuova_revisione.cad_file = precedente.cad_file
         db.add(nuova_revisione)
     if precedente.files:
+        # solo metadati: la nuova revisione condivide i blob della precedente (riferimenti +1)
         for file_entry in precedente.files:
-            src = Path(file_entry.filepath)
-            dest_dir = REV_FILES_DIR / str(nuova_revisione.id)
-            dest_dir.mkdir(parents=True, exist_ok=True)
-            if src.exists():
-                new_name = f"{uuid.uuid4().hex}_{Path(file_entry.filename).name}"
-                dest_path = dest_dir / new_name
-                shutil.copy2(src, dest_path)
-                cloned_path = dest_path
-                cloned_name = file_entry.filename
-            else:
-                cloned_path = Path(file_entry.filepath)
-                cloned_name = file_entry.filename
             new_file = models.RevisioneFile(
                 revisione_id=nuova_revisione.id,
-                filename=cloned_name,
-                filepath=str(cloned_path),
+                filename=file_entry.filename,
+                filepath=file_entry.filepath,
                 mimetype=file_entry.mimetype,
+                dimensione=file_entry.dimensione,
+                sha256=file_entry.sha256,
             )
             db.add(new_file)
     db.commit()
@@ -229,7 +233,7 @@ def rilascia_revisione(
 
 
 @router.get("/{codice}/{indice}/certificazione", response_model=List[CertCampo])
-def get_certificazione(codice: str, indice: int, db: Session = Depends(database.get_db)):
+def get_certificazione(codice: str, indice: int, db: Session = Depends(database.get_read_db)):
     revisione = _get_revision_or_404(db, codice, indice)
     fields = load_form_fields()
     existing = {campo.nome.lower(): campo for campo in revisione.certificazione}
@@ -346,48 +350,96 @@ def cambia_stato_revisione(
 
 
 @router.get("/{codice}/{indice}/files", response_model=List[RevisioneFilePayload])
-def lista_file_revisione(codice: str, indice: int, db: Session = Depends(database.get_db)):
+def lista_file_revisione(codice: str, indice: int, db: Session = Depends(database.get_read_db)):
     revisione = _get_revision_or_404(db, codice, indice)
     return _files_payload(revisione)
 
 
+@router.api_route("/{codice}/{indice}/files/{file_id}", methods=["GET", "HEAD"])
+def scarica_file_revisione(
+    codice: str,
+    indice: int,
+    file_id: int,
+    request: Request,
+    db: Session = Depends(database.get_read_db),
+):
+    file_obj = (
+        db.query(models.RevisioneFile)
+        .join(models.Revisione)
+        .join(models.Codice)
+        .filter(
+            models.Codice.codice == codice,
+            models.Revisione.indice == indice,
+            models.RevisioneFile.id == file_id,
+        )
+        .first()
+    )
+    if not file_obj:
+        raise HTTPException(status_code=404, detail="File non trovato")
+    return file_download(request, file_obj.filepath, file_obj.filename, file_obj.sha256, file_obj.mimetype)
+
+
+def _insert_revision_files(
+    db: Session, revisione_id: int, uploads: List[Tuple[str, str, StagedFile]]
+) -> List[RevisioneFilePayload]:
+    for filename, mimetype, item in uploads:
+        db.add(
+            models.RevisioneFile(
+                revisione_id=revisione_id,
+                filename=filename,
+                filepath=str(item.final_path),
+                mimetype=mimetype or "",
+                dimensione=item.size,
+                sha256=item.sha256,
+            )
+        )
+    db.commit()
+    # elenco completo riletto dopo il commit (uploaded_at è assegnato dal database)
+    return _files_payload(db.get(models.Revisione, revisione_id))
+
+
 @router.post("/{codice}/{indice}/files", response_model=List[RevisioneFilePayload])
 async def carica_file_revisione(
     codice: str,
     indice: int,
     files: List[UploadFile] = File(...),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     account_ctx: dict = Depends(require_account_context),
 ):
-    revisione = _get_revision_or_404(db, codice, indice)
+    revisione = await db.scalar(
+        select(models.Revisione)
+        .join(models.Codice)
+        .where(models.Codice.codice == codice, models.Revisione.indice == indice)
+    )
+    if not revisione:
+        raise HTTPException(status_code=404, detail="Revisione non trovata")
     if revisione.is_released:
         raise HTTPException(status_code=400, detail="Revisione rilasciata: impossibile caricare file")
     if not files:
         raise HTTPException(status_code=400, detail="Nessun file ricevuto")
-
-    saved_records = []
-    for upload in files:
-        dest_dir = REV_FILES_DIR / str(revisione.id)
-        dest_dir.mkdir(parents=True, exist_ok=True)
-        unique_name = f"{uuid.uuid4().hex}_{upload.filename}"
-        dest_path = dest_dir / unique_name
-        with dest_path.open("wb") as buffer:
-            shutil.copyfileobj(upload.file, buffer)
-        record = models.RevisioneFile(
-            revisione_id=revisione.id,
-            filename=upload.filename,
-            filepath=str(dest_path),
-            mimetype=upload.content_type or "",
-        )
-        db.add(record)
-        saved_records.append(record)
-
-    db.commit()
-    db.refresh(revisione)
+    # libera la connessione durante la copia
+    await db.commit()
+
+    # file scritti a blocchi in temporanei, spostati nel blob store prima del commit delle righe
+    staged = StagedUploads()
+    try:
+        uploads = []
+        for upload in files:
+            item = await staged.add(upload)
+            uploads.append((upload.filename, upload.content_type, item))
+        await staged.promote()
+        payload = await database.run_write(_insert_revision_files, revisione.id, uploads)
+        staged.release()
+    except UploadTooLarge as exc:
+        await staged.discard(db)
+        raise HTTPException(status_code=413, detail=str(exc))
+    except BaseException:
+        await staged.discard(db)
+        raise
     log_activity(
         account_ctx,
         "revisione_carica_file",
         riferimento=f"{codice}:rev{indice}",
-        dettagli=f"{len(saved_records)} file",
+        dettagli=f"{len(uploads)} file",
     )
-    return _files_payload(revisione)
+    return payload
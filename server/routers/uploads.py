@@ -0,0 +1,232 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from core import models, database
+from core.auth_context import require_account_context
+from core.activity_logger import log_activity
+from core.upload_pipeline import MAX_FILE_BYTES, StagedFile, StagedUploads, UploadTooLarge
+from core.upload_sessions import (
+    DEFAULT_CHUNK_SIZE,
+    MAX_CHUNK_SIZE,
+    ChunkRejected,
+    chunk_count,
+    missing_chunks,
+    new_session_id,
+    purge_expired_sessions,
+    read_assembled,
+    remove_session_files,
+    write_chunk,
+)
+
+router = APIRouter(prefix="/uploads", tags=["Caricamenti"])
+
+
+class UploadCreate(BaseModel):
+    codice: str
+    indice: int
+    filename: str
+    size: int = Field(..., ge=0)
+    mimetype: Optional[str] = None
+    sha256: Optional[str] = None
+    chunk_size: int = Field(DEFAULT_CHUNK_SIZE, ge=64 * 1024, le=MAX_CHUNK_SIZE)
+
+
+class UploadStatus(BaseModel):
+    id: str
+    filename: str
+    size: int
+    chunk_size: int
+    chunk_count: int
+    missing: List[int]
+
+
+class RevisioneFileOut(BaseModel):
+    id: int
+    filename: str
+    mimetype: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+
+async def _open_revision(db: AsyncSession, codice: str, indice: int) -> models.Revisione:
+    revisione = await db.scalar(
+        select(models.Revisione)
+        .join(models.Codice)
+        .where(models.Codice.codice == codice, models.Revisione.indice == indice)
+    )
+    if not revisione:
+        raise HTTPException(status_code=404, detail="Revisione non trovata")
+    if revisione.is_released:
+        raise HTTPException(status_code=400, detail="Revisione rilasciata: impossibile caricare file")
+    return revisione
+
+
+async def _get_session(db: AsyncSession, upload_id: str, account_ctx: dict) -> models.UploadSessione:
+    sessione = await db.get(models.UploadSessione, upload_id)
+    if not sessione or sessione.account != account_ctx.get("account"):
+        raise HTTPException(status_code=404, detail="Sessione di caricamento non trovata")
+    return sessione
+
+
+async def _status(sessione: models.UploadSessione) -> UploadStatus:
+    return UploadStatus(
+        id=sessione.id,
+        filename=sessione.filename,
+        size=sessione.dimensione,
+        chunk_size=sessione.chunk_size,
+        chunk_count=chunk_count(sessione),
+        missing=await missing_chunks(sessione),
+    )
+
+
+def _create_session(db: Session, sessione: models.UploadSessione) -> None:
+    # pulizia opportunistica delle sessioni abbandonate
+    purge_expired_sessions(db.connection())
+    db.add(sessione)
+    db.commit()
+    db.refresh(sessione)
+
+
+def _touch_session(db: Session, upload_id: str) -> None:
+    db.execute(
+        update(models.UploadSessione)
+        .where(models.UploadSessione.id == upload_id)
+        .values(updated_at=func.now())
+    )
+    db.commit()
+
+
+def _complete_session(db: Session, upload_id: str, revisione_id: int, item: StagedFile) -> RevisioneFileOut:
+    record = models.RevisioneFile(
+        revisione_id=revisione_id,
+        filename=item.filename,
+        filepath=str(item.final_path),
+        mimetype=item.content_type,
+        dimensione=item.size,
+        sha256=item.sha256,
+    )
+    db.add(record)
+    db.execute(delete(models.UploadSessione).where(models.UploadSessione.id == upload_id))
+    db.commit()
+    return RevisioneFileOut(
+        id=record.id,
+        filename=record.filename,
+        mimetype=record.mimetype,
+        size=record.dimensione,
+        sha256=record.sha256,
+    )
+
+
+def _delete_session(db: Session, upload_id: str) -> None:
+    db.execute(delete(models.UploadSessione).where(models.UploadSessione.id == upload_id))
+    db.commit()
+
+
+@router.post("", response_model=UploadStatus, status_code=201)
+async def crea_sessione(
+    payload: UploadCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    account_ctx: dict = Depends(require_account_context),
+):
+    """Apre un caricamento a blocchi verso una revisione: i blocchi si inviano con PUT e si chiude con commit."""
+    if payload.size > MAX_FILE_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"File oltre il limite di {MAX_FILE_BYTES // (1024 * 1024)} MB"
+        )
+    revisione = await _open_revision(db, payload.codice, payload.indice)
+    await db.commit()
+    sessione = models.UploadSessione(
+        id=new_session_id(),
+        revisione_id=revisione.id,
+        account=account_ctx.get("account"),
+        filename=payload.filename,
+        mimetype=payload.mimetype or "",
+        dimensione=payload.size,
+        chunk_size=payload.chunk_size,
+        sha256=payload.sha256.lower() if payload.sha256 else None,
+    )
+    await database.run_write(_create_session, sessione)
+    return await _status(sessione)
+
+
+@router.get("/{upload_id}", response_model=UploadStatus)
+async def stato_sessione(
+    upload_id: str,
+    db: AsyncSession = Depends(database.get_async_db),
+    account_ctx: dict = Depends(require_account_context),
+):
+    """Blocchi ancora mancanti: dopo un'interruzione il client rinvia solo questi."""
+    sessione = await _get_session(db, upload_id, account_ctx)
+    return await _status(sessione)
+
+
+@router.put("/{upload_id}/chunks/{numero}", status_code=204)
+async def carica_blocco(
+    upload_id: str,
+    numero: int,
+    request: Request,
+    chunk_sha256: str = Header(..., alias="X-Chunk-SHA256"),
+    db: AsyncSession = Depends(database.get_async_db),
+    account_ctx: dict = Depends(require_account_context),
+):
+    sessione = await _get_session(db, upload_id, account_ctx)
+    await db.commit()
+    try:
+        await write_chunk(sessione, numero, request.stream(), chunk_sha256)
+    except ChunkRejected as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    await database.run_write(_touch_session, upload_id)
+
+
+@router.post("/{upload_id}/commit", response_model=RevisioneFileOut)
+async def completa_sessione(
+    upload_id: str,
+    db: AsyncSession = Depends(database.get_async_db),
+    account_ctx: dict = Depends(require_account_context),
+):
+    """Ricompone il file dai blocchi (in streaming, con hash) e lo aggiunge alla revisione."""
+    sessione = await _get_session(db, upload_id, account_ctx)
+    revisione = await db.get(models.Revisione, sessione.revisione_id)
+    if revisione is None or revisione.is_released:
+        raise HTTPException(status_code=400, detail="Revisione rilasciata: impossibile caricare file")
+    mancanti = await missing_chunks(sessione)
+    if mancanti:
+        raise HTTPException(status_code=409, detail={"missing": mancanti})
+    await db.commit()
+
+    staged = StagedUploads()
+    try:
+        item = await staged.add_stream(sessione.filename, sessione.mimetype, read_assembled(sessione))
+        if item.size != sessione.dimensione or (sessione.sha256 and item.sha256 != sessione.sha256):
+            raise HTTPException(status_code=422, detail="Il file ricomposto non corrisponde a dimensione/hash dichiarati")
+        await staged.promote()
+        risultato = await database.run_write(_complete_session, upload_id, sessione.revisione_id, item)
+        staged.release()
+    except UploadTooLarge as exc:
+        await staged.discard(db)
+        raise HTTPException(status_code=413, detail=str(exc))
+    except BaseException:
+        await staged.discard(db)
+        raise
+    await run_in_threadpool(remove_session_files, upload_id)
+
+    log_activity(account_ctx, "revisione_carica_file", riferimento=f"rev:{sessione.revisione_id}", dettagli=item.filename)
+    return risultato
+
+
+@router.delete("/{upload_id}", status_code=204)
+async def annulla_sessione(
+    upload_id: str,
+    db: AsyncSession = Depends(database.get_async_db),
+    account_ctx: dict = Depends(require_account_context),
+):
+    await _get_session(db, upload_id, account_ctx)
+    await db.commit()
+    await database.run_write(_delete_session, upload_id)
+    await run_in_threadpool(remove_session_files, upload_id)
@@ -0,0 +1,256 @@
+"""
+Carico misto: latenza di una richiesta leggera (/codici/search) mentre il server serve
+caricamenti grandi su /revisioni/{codice}/0/files e letture pesanti del dettaglio di un codice
+con molte revisioni. Avvia uvicorn su un database temporaneo.
+
+La sonda è a ciclo aperto: invia a frequenza fissa e misura dall'istante programmato, così un
+blocco del server conta per tutte le richieste che avrebbero dovuto partire nel frattempo (una
+sonda che aspetta la risposta prima di inviare la successiva ne registrerebbe una sola).
+Sonda, lettori e caricamenti girano in processi separati.
+
+    python tests/bench_carico_misto.py [--uploads 3] [--mb 200] [--letture 10] [--server-dir DIR]
+
+--server-dir misura un'altra versione del server (es. `git worktree` di un commit precedente).
+
+Riferimento (1 CPU, valori di default, mediana di 3 esecuzioni), route di lettura sincrone -> async:
+
+    caricamenti + lettori   sonda p50/p95/p99   84/332/480 ms -> 36/120/196 ms
+                            dettaglio p50/p95  161/454 ms     -> 117/260 ms
+                            caricamento più lento  56 s       -> 31 s
+    solo lettori            sonda p50 14 -> 9 ms, dettaglio p50 60 -> 48 ms
+    solo caricamenti        sonda p50 16 -> 13 ms
+
+Una delle tre esecuzioni async ha avuto un picco (sonda p95 460 ms con caricamenti + lettori).
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+HEADERS = {"X-PLM-Account": "da assegnare|da assegnare|Zinne"}
+PROBE_RATE = 50
+DURATA_SENZA_CARICO = 5.0
+
+_POPOLA = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from core import database, models
+from core.state_manager import resolve_state
+
+stato = resolve_state(None)
+with database.SessionLocal() as db:
+    codice = models.Codice(codice=sys.argv[2], descrizione="prova lettura", quantita=1, ubicazione="A")
+    db.add(codice)
+    db.flush()
+    for indice in range(int(sys.argv[3])):
+        revisione = models.Revisione(codice_id=codice.id, indice=indice, stato=stato)
+        revisione.certificazione = [
+            models.CertificazioneCampo(nome=f"campo{n}", valore="prova", ordine=n) for n in range(6)
+        ]
+        revisione.files = [
+            models.RevisioneFile(filename=f"r{indice}_{n}.step", filepath=f"r{indice}_{n}.step") for n in range(3)
+        ]
+        db.add(revisione)
+    db.commit()
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _open_loop(url, params, rate, stop):
+    """Richieste GET a frequenza fissa; latenze misurate dall'istante programmato, errori contati a parte."""
+    latenze = []
+    errori = []
+    intervallo = 1 / rate
+
+    async def _una(client, programmata):
+        try:
+            (await client.get(url, params=params)).raise_for_status()
+        except httpx.HTTPError:
+            errori.append(programmata)
+            return
+        latenze.append((time.perf_counter() - programmata) * 1000)
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        tasks = []
+        prossima = time.perf_counter()
+        while not stop.is_set():
+            tasks.append(asyncio.create_task(_una(client, prossima)))
+            prossima += intervallo
+            await asyncio.sleep(max(0.0, prossima - time.perf_counter()))
+        await asyncio.gather(*tasks)
+    return latenze, len(errori)
+
+
+def _sonda(url, params, rate, stop, results):
+    results.put(asyncio.run(_open_loop(url, params, rate, stop)))
+
+
+def _misura(base_url, carico, codice_lettura=None, letture_al_secondo=0):
+    """Latenze della sonda e dei lettori del dettaglio mentre gira `carico()`."""
+    stop = multiprocessing.Event()
+    sonda = multiprocessing.Queue()
+    lettori = multiprocessing.Queue()
+    processi = [
+        multiprocessing.Process(
+            target=_sonda,
+            args=(f"{base_url}/codici/search", {"q": "prova", "include_unreleased": True}, PROBE_RATE, stop, sonda),
+        )
+    ]
+    if letture_al_secondo:
+        processi.append(
+            multiprocessing.Process(
+                target=_sonda,
+                args=(
+                    f"{base_url}/codici/{codice_lettura}/dettaglio",
+                    {"include_unreleased": True},
+                    letture_al_secondo,
+                    stop,
+                    lettori,
+                ),
+            )
+        )
+    for processo in processi:
+        processo.start()
+    carico()
+    stop.set()
+    latenze = sonda.get()
+    dettagli = lettori.get() if letture_al_secondo else None
+    for processo in processi:
+        processo.join()
+    return latenze, dettagli
+
+
+def _percentili(latenze):
+    percentili = statistics.quantiles(latenze, n=100)
+    return (
+        f"p50 {statistics.median(latenze):7.1f}  p95 {percentili[94]:7.1f}"
+        f"  p99 {percentili[98]:7.1f}  max {max(latenze):7.1f} ms"
+    )
+
+
+def _riepilogo(nome, misura):
+    (latenze, errori), dettagli = misura
+    print(f"{nome:<24} sonda     n={len(latenze):>5}  {_percentili(latenze)}  errori {errori}")
+    if dettagli:
+        latenze, errori = dettagli
+        print(f"{'':<24} dettaglio n={len(latenze):>5}  {_percentili(latenze)}  errori {errori}")
+
+
+def _avvia_server(server_dir: Path, directory: Path):
+    port = _free_port()
+    env = {
+        **os.environ,
+        "PLM_DATABASE_URL": f"sqlite:///{directory / 'plm.db'}",
+        "PLM_SESSION_SECRET": "bench",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(server_dir), "--port", str(port)],
+        cwd=directory,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/")
+            return process, base_url, env
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Il server non risponde")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=3)
+    parser.add_argument("--mb", type=int, default=200)
+    parser.add_argument("--letture", type=float, default=10, help="dettagli richiesti al secondo")
+    parser.add_argument("--revisioni", type=int, default=100)
+    parser.add_argument("--server-dir", type=Path, default=Path(__file__).resolve().parent.parent)
+    args = parser.parse_args()
+    server_dir = args.server_dir.resolve()
+
+    with tempfile.TemporaryDirectory(prefix="plm-bench-") as directory:
+        directory = Path(directory)
+        sorgente = directory / "grande.bin"
+        with sorgente.open("wb") as handle:
+            for _ in range(args.mb):
+                handle.write(os.urandom(1024 * 1024))
+
+        server, base_url, env = _avvia_server(server_dir, directory)
+        try:
+            payload = {"codice": "03", "descrizione": "prova", "quantita": 1, "ubicazione": "A"}
+            codice = httpx.post(f"{base_url}/codici/", json=payload, headers=HEADERS).json()["codice"]
+            # crea la rev0
+            httpx.get(f"{base_url}/codici/{codice}/dettaglio", params={"include_unreleased": True})
+            codice_lettura = "BENCH-LETTURA"
+            subprocess.run(
+                [sys.executable, "-c", _POPOLA, str(server_dir), codice_lettura, str(args.revisioni)],
+                cwd=directory,
+                env=env,
+                check=True,
+            )
+
+            def _carica():
+                with sorgente.open("rb") as handle:
+                    httpx.post(
+                        f"{base_url}/revisioni/{codice}/0/files",
+                        files=[("files", ("grande.bin", handle))],
+                        headers=HEADERS,
+                        timeout=600,
+                    ).raise_for_status()
+
+            def _caricamenti():
+                threads = [threading.Thread(target=_carica) for _ in range(args.uploads)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            durata_caricamenti = []
+
+            def _caricamenti_cronometrati():
+                start = time.perf_counter()
+                _caricamenti()
+                durata_caricamenti.append(time.perf_counter() - start)
+
+            print(
+                f"sonda /codici/search a {PROBE_RATE} richieste/s; {args.uploads} caricamenti da {args.mb} MB;"
+                f" {args.letture:g} dettagli/s ({args.revisioni} revisioni)"
+            )
+            _riepilogo("senza carico", _misura(base_url, lambda: time.sleep(DURATA_SENZA_CARICO)))
+            _riepilogo("caricamenti", _misura(base_url, _caricamenti_cronometrati))
+            _riepilogo(
+                "lettori",
+                _misura(base_url, lambda: time.sleep(DURATA_SENZA_CARICO), codice_lettura, args.letture),
+            )
+            _riepilogo(
+                "caricamenti + lettori",
+                _misura(base_url, _caricamenti_cronometrati, codice_lettura, args.letture),
+            )
+            print("durata caricamenti: " + ", ".join(f"{d:.1f} s" for d in durata_caricamenti))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
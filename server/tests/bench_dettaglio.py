@@ -0,0 +1,55 @@
+"""
+Latenza di GET /codici/{codice}/dettaglio al crescere delle revisioni (database temporaneo).
+
+    python tests/bench_dettaglio.py [--richieste 200]
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from support import crea_codice_con_revisioni, use_temp_database
+
+REVISIONI = (1, 10, 50, 200)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--richieste", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="plm-bench-") as directory:
+        use_temp_database(Path(directory))
+        from fastapi.testclient import TestClient
+        from sqlalchemy import event
+
+        import main as server
+        from core import database
+
+        query = []
+        event.listen(database.async_engine.sync_engine, "before_cursor_execute", lambda *_args: query.append(1))
+
+        with TestClient(server.app) as client:
+            print(f"{'revisioni':>9} {'query':>6} {'KiB':>6} {'p50 ms':>8} {'p95 ms':>8}")
+            for n, revisioni in enumerate(REVISIONI):
+                codice = crea_codice_con_revisioni(f"03{n:06d}A", revisioni=revisioni)
+                url = f"/codici/{codice}/dettaglio?include_unreleased=true"
+                query.clear()
+                kib = len(client.get(url).content) / 1024
+                numero_query = len(query)
+                tempi = []
+                for _ in range(args.richieste):
+                    start = time.perf_counter()
+                    client.get(url).raise_for_status()
+                    tempi.append((time.perf_counter() - start) * 1000)
+                p95 = statistics.quantiles(tempi, n=20)[-1]
+                print(
+                    f"{revisioni:>9} {numero_query:>6} {kib:>6.0f} "
+                    f"{statistics.median(tempi):>8.2f} {p95:>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
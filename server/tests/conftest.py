@@ -0,0 +1,48 @@
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from support import use_temp_database
+
+# il database si configura all'import di core.database: prima di qualunque test
+_TMP = tempfile.TemporaryDirectory(prefix="plm-test-")
+use_temp_database(Path(_TMP.name))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def count_queries():
+    """Conta le istruzioni SQL eseguite (su tutti gli engine, anche l'asincrono) dentro il blocco `with`."""
+    from contextlib import contextmanager
+
+    from sqlalchemy import event
+
+    from core import database
+
+    @contextmanager
+    def _count():
+        statements = []
+
+        def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engines = (database.engine, database.read_engine, database.async_engine.sync_engine)
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+
+    return _count
@@ -0,0 +1,43 @@
+"""Utilità comuni a test e benchmark: database SQLite temporaneo e dati di prova."""
+
+import os
+import sys
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def use_temp_database(directory: Path) -> None:
+    """Punta il server a un database vuoto in `directory`; va chiamata prima di importare `core`."""
+    os.environ["PLM_DATABASE_URL"] = f"sqlite:///{directory / 'plm.db'}"
+    os.environ.setdefault("PLM_SESSION_SECRET", "test")
+    # file caricati (uploaded_files/) relativi alla cartella di lavoro
+    os.chdir(directory)
+    if str(SERVER_DIR) not in sys.path:
+        sys.path.insert(0, str(SERVER_DIR))
+
+
+def crea_codice_con_revisioni(codice: str, revisioni: int, file_per_revisione: int = 2) -> str:
+    """Codice con `revisioni` revisioni, ognuna con una certificazione e alcuni file."""
+    from core import database, models
+    from core.state_manager import resolve_state
+
+    stato = resolve_state(None)
+    with database.SessionLocal() as db:
+        codice_obj = models.Codice(codice=codice, descrizione="prova", quantita=1, ubicazione="A")
+        db.add(codice_obj)
+        db.flush()
+        for indice in range(revisioni):
+            revisione = models.Revisione(codice_id=codice_obj.id, indice=indice, stato=stato)
+            revisione.certificazione = [
+                models.CertificazioneCampo(nome="descrizione", valore="prova", ordine=0),
+                models.CertificazioneCampo(nome="quantita", valore="1", ordine=1),
+            ]
+            revisione.files = [
+                models.RevisioneFile(filename=f"r{indice}_{n}.step", filepath=f"r{indice}_{n}.step")
+                for n in range(file_per_revisione)
+            ]
+            db.add(revisione)
+        db.add(models.FileModel(codice_id=codice_obj.id, filename="disegno.pdf", filepath="disegno.pdf"))
+        db.commit()
+    return codice
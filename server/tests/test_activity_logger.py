@@ -0,0 +1,109 @@
+import queue
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+ACCOUNT = {"account": "Zinne", "stabilimento": "da assegnare", "gruppo": "da assegnare"}
+
+
+def _voce(azione):
+    from datetime import datetime, timezone
+
+    return {
+        "account": "Zinne",
+        "stabilimento": "da assegnare",
+        "gruppo": "da assegnare",
+        "azione": azione,
+        "riferimento": None,
+        "dettagli": "",
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def _conta(azione):
+    from core import database, models
+
+    log = models.AttivitaLog.__table__
+    with database.engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(log).where(log.c.azione == azione))
+
+
+def test_coda_piena_non_blocca_e_non_perde_voci(client, monkeypatch):
+    from core import activity_logger
+
+    piena = queue.Queue(maxsize=1)
+    piena.put_nowait(_voce("test_coda_piena"))
+    monkeypatch.setattr(activity_logger, "_queue", piena)
+    monkeypatch.setattr(activity_logger, "_ensure_writer", lambda: None)
+
+    activity_logger.log_activity(ACCOUNT, "test_coda_piena")
+
+    assert len(activity_logger._pending) == 1
+    activity_logger.flush_activity_log()
+    assert _conta("test_coda_piena") == 2
+
+
+def test_blocco_riprovato_se_il_database_non_risponde(client, monkeypatch):
+    from core import activity_logger
+
+    scrivi = activity_logger._write_batch
+    tentativi = []
+
+    def _bloccato_una_volta(entries, target_engine=None):
+        tentativi.append(len(entries))
+        if len(tentativi) == 1:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        scrivi(entries, target_engine)
+
+    monkeypatch.setattr(activity_logger, "_write_batch", _bloccato_una_volta)
+    monkeypatch.setattr(activity_logger, "FLUSH_INTERVAL_SECONDS", 0.01)
+    # writer in funzione (un test precedente può averlo fermato)
+    activity_logger._stop.clear()
+    activity_logger._write_with_retry([_voce("test_ritentato"), _voce("test_ritentato")])
+
+    assert tentativi == [2, 2]
+    assert _conta("test_ritentato") == 2
+
+
+def test_voce_non_valida_scartata_da_sola(client, monkeypatch):
+    from core import activity_logger
+
+    scrivi = activity_logger._write_batch
+
+    def _rifiuta_non_valide(entries, target_engine=None):
+        if any(entry["azione"] == "test_non_valida" for entry in entries):
+            raise IntegrityError("INSERT", {}, Exception("NOT NULL constraint failed"))
+        scrivi(entries, target_engine)
+
+    monkeypatch.setattr(activity_logger, "_write_batch", _rifiuta_non_valide)
+    activity_logger._write_with_retry([_voce("test_valida"), _voce("test_non_valida"), _voce("test_valida")])
+
+    assert _conta("test_valida") == 2
+    assert _conta("test_non_valida") == 0
+
+
+def test_modalita_sincrona_non_scrive_sull_event_loop(client, monkeypatch):
+    import asyncio
+    import threading
+
+    from core import activity_logger
+
+    scrivi = activity_logger._write_batch
+    thread_scrittura = []
+
+    def _registra_thread(entries, target_engine=None):
+        thread_scrittura.append(threading.current_thread())
+        scrivi(entries, target_engine)
+
+    monkeypatch.setattr(activity_logger, "SYNC_MODE", True)
+    monkeypatch.setattr(activity_logger, "_write_batch", _registra_thread)
+
+    async def _route_async():
+        activity_logger.log_activity(ACCOUNT, "test_sincrona")
+        # lascia completare la scrittura nel threadpool
+        await asyncio.get_running_loop().run_in_executor(None, lambda: None)
+        return threading.current_thread()
+
+    thread_loop = asyncio.run(_route_async())
+    assert thread_scrittura and thread_scrittura[0] is not thread_loop
+    assert _conta("test_sincrona") == 1
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+
+HEADERS = {"X-PLM-Account": "da assegnare|da assegnare|Zinne"}
+
+
+def _registra(azione, *orari_utc):
+    from core import database, models
+
+    with database.engine.begin() as connection:
+        connection.execute(
+            insert(models.AttivitaLog.__table__),
+            [
+                {
+                    "account": "Zinne",
+                    "stabilimento": "da assegnare",
+                    "gruppo": "da assegnare",
+                    "azione": azione,
+                    "dettagli": "",
+                    "created_at": orario,
+                }
+                for orario in orari_utc
+            ],
+        )
+
+
+def _orari(client, **params):
+    response = client.get("/attivita", params=params, headers=HEADERS)
+    assert response.status_code == 200
+    return sorted(item["created_at"] for item in response.json()["items"])
+
+
+def test_filtro_date_con_fuso_orario(client):
+    _registra("test_fuso", datetime(2026, 3, 10, 10, 0), datetime(2026, 3, 10, 12, 0))
+
+    # 11:30+02:00 = 09:30 UTC: entrambe le voci sono successive
+    assert len(_orari(client, azione="test_fuso", dal="2026-03-10T11:30:00+02:00")) == 2
+    # 11:30Z: solo quella delle 12:00 UTC
+    assert _orari(client, azione="test_fuso", dal="2026-03-10T11:30:00Z") == ["2026-03-10T12:00:00"]
+    # 13:00+02:00 = 11:00 UTC come limite superiore esclusivo: solo quella delle 10:00
+    assert _orari(client, azione="test_fuso", al="2026-03-10T13:00:00+02:00") == ["2026-03-10T10:00:00"]
+    # senza fuso il parametro è già UTC
+    assert _orari(client, azione="test_fuso", dal="2026-03-10T11:30:00") == ["2026-03-10T12:00:00"]
+
+
+def test_attivita_richiede_account(client):
+    assert client.get("/attivita").status_code == 401
+    assert client.get("/attivita/riepilogo").status_code == 401
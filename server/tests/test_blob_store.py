@@ -0,0 +1,52 @@
+import hashlib
+from pathlib import Path
+
+from sqlalchemy import insert, select
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_import_non_archivia_file_sovrascritti(client):
+    from core import blob_store, database, models
+
+    legacy = Path("uploaded_files/legacy")
+    legacy.mkdir(parents=True, exist_ok=True)
+    originale, sovrascritto = b"prima versione", b"seconda versione"
+    (legacy / "a.step").write_bytes(sovrascritto)
+
+    table = models.FileModel.__table__
+    with database.engine.begin() as connection:
+        codice_id = connection.execute(
+            insert(models.Codice.__table__).values(codice="LEGACY1", descrizione="", quantita=1, ubicazione="")
+        ).inserted_primary_key[0]
+        vecchia, recente = (
+            connection.execute(
+                insert(table).values(
+                    codice_id=codice_id, filename="a.step", filepath=str(legacy / "a.step"), sha256=_sha(data)
+                )
+            ).inserted_primary_key[0]
+            for data in (originale, sovrascritto)
+        )
+        cleanup = blob_store.import_existing_files(connection)
+    cleanup()
+
+    with database.engine.connect() as connection:
+        righe = dict(connection.execute(select(table.c.id, table.c.sha256).where(table.c.codice_id == codice_id)).all())
+    # l'hash della riga più vecchia descrive un contenuto che non esiste più
+    assert righe[vecchia] is None
+    assert not blob_store.blob_path(_sha(originale)).exists()
+    assert righe[recente] == _sha(sovrascritto)
+    assert blob_store.blob_path(_sha(sovrascritto)).read_bytes() == sovrascritto
+    # il file resta finché una riga lo usa
+    assert (legacy / "a.step").exists()
+
+
+def test_purge_temporanei_orfani():
+    from core import blob_store
+
+    blob_store.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    (blob_store.TEMP_DIR / "interrotto.part").write_bytes(b"x")
+    assert blob_store.purge_orphan_temp_files() >= 1
+    assert not list(blob_store.TEMP_DIR.glob("*.part"))
@@ -0,0 +1,42 @@
+from support import crea_codice_con_revisioni
+
+
+def _dettaglio(client, codice):
+    response = client.get(f"/codici/{codice}/dettaglio", params={"include_unreleased": True})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_dettaglio_numero_query_costante(client, count_queries):
+    pochi = crea_codice_con_revisioni("03000901A", revisioni=1)
+    molti = crea_codice_con_revisioni("03000902A", revisioni=50)
+    # primo accesso: configurazione stati e cache già pronte per le misure
+    _dettaglio(client, pochi)
+
+    with count_queries() as query_pochi:
+        dettaglio = _dettaglio(client, pochi)
+    assert len(dettaglio["revisioni"]) == 1
+
+    with count_queries() as query_molti:
+        dettaglio = _dettaglio(client, molti)
+    assert len(dettaglio["revisioni"]) == 50
+    assert all(len(rev["files"]) == 2 for rev in dettaglio["revisioni"])
+
+    assert len(query_molti) == len(query_pochi)
+    assert query_molti
+    # codice, revisioni, certificazioni, file revisione, file codice
+    assert len(query_molti) <= 5
+
+
+def test_dettagli_batch_numero_query_costante(client, count_queries):
+    codici = [crea_codice_con_revisioni(f"03000{910 + n}A", revisioni=n + 1) for n in range(10)]
+
+    with count_queries() as query_uno:
+        response = client.post("/codici/dettagli", json={"codici": codici[:1], "include_unreleased": True})
+    assert response.status_code == 200
+
+    with count_queries() as query_tutti:
+        response = client.post("/codici/dettagli", json={"codici": codici, "include_unreleased": True})
+    assert response.status_code == 200
+    assert len(response.json()["dettagli"]) == 10
+    assert len(query_tutti) == len(query_uno)
@@ -0,0 +1,141 @@
+import asyncio
+import os
+
+import aiofiles.os
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from support import crea_codice_con_revisioni
+
+
+def _conta_file():
+    from core import database, models
+
+    with database.engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(models.RevisioneFile))
+
+
+def test_promote_fallito_non_lascia_righe(client, monkeypatch):
+    import main
+
+    codice = crea_codice_con_revisioni("03000950A", revisioni=1, file_per_revisione=0)
+    prima = _conta_file()
+
+    async def _disco_pieno(*_args, **_kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(aiofiles.os, "replace", _disco_pieno)
+    with TestClient(main.app, raise_server_exceptions=False) as failing_client:
+        response = failing_client.post(
+            f"/revisioni/{codice}/0/files",
+            files=[("files", ("a.bin", os.urandom(4096)))],
+            headers={"X-PLM-Account": "da assegnare|da assegnare|Zinne"},
+        )
+    assert response.status_code == 500
+    assert _conta_file() == prima
+
+
+def test_commit_fallito_elimina_il_blob_creato(client, monkeypatch):
+    import hashlib
+
+    from sqlalchemy.orm import Session
+
+    import main
+    from core import database
+    from core.blob_store import blob_path
+
+    codice = crea_codice_con_revisioni("03000951A", revisioni=1, file_per_revisione=0)
+    prima = _conta_file()
+    contenuto = os.urandom(4096)
+    commit_originale = Session.commit
+
+    def _commit_fallisce_in_scrittura(self):
+        if self.bind is database.engine:
+            raise OSError(5, "Input/output error")
+        commit_originale(self)
+
+    monkeypatch.setattr(Session, "commit", _commit_fallisce_in_scrittura)
+    with TestClient(main.app, raise_server_exceptions=False) as failing_client:
+        response = failing_client.post(
+            f"/revisioni/{codice}/0/files",
+            files=[("files", ("a.bin", contenuto))],
+            headers={"X-PLM-Account": "da assegnare|da assegnare|Zinne"},
+        )
+    monkeypatch.undo()
+    assert response.status_code == 500
+    assert _conta_file() == prima
+    assert not blob_path(hashlib.sha256(contenuto).hexdigest()).exists()
+
+
+def test_pulizia_file_blob_senza_riga(client):
+    from core import database
+    from core.blob_store import blob_path, purge_untracked_blob_files
+
+    codice = crea_codice_con_revisioni("03000952A", revisioni=1, file_per_revisione=0)
+    response = client.post(
+        f"/revisioni/{codice}/0/files",
+        files=[("files", ("b.bin", os.urandom(2048)))],
+        headers={"X-PLM-Account": "da assegnare|da assegnare|Zinne"},
+    )
+    assert response.status_code == 200
+    referenziato = blob_path(response.json()[0]["sha256"])
+    orfano = blob_path("ab" + "0" * 62)
+    orfano.parent.mkdir(parents=True, exist_ok=True)
+    orfano.write_bytes(b"nessuna riga")
+
+    assert purge_untracked_blob_files(database.engine) >= 1
+    assert not orfano.exists()
+    assert referenziato.exists()
+
+
+def _richiesta(middleware, headers, chunks):
+    """Esegue il middleware su un'app che legge tutto il corpo; restituisce (status, byte letti dall'app)."""
+    letti = []
+    inviati = []
+    messaggi = [{"type": "http.request", "body": c, "more_body": True} for c in chunks]
+    messaggi.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        return messaggi.pop(0)
+
+    async def send(message):
+        inviati.append(message)
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            letti.append(len(message.get("body", b"")))
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    scope = {"type": "http", "headers": headers}
+    asyncio.run(middleware(app)(scope, receive, send))
+    return inviati[0]["status"], sum(letti)
+
+
+def test_limite_dichiarato_rifiutato_senza_leggere_il_corpo():
+    from core.upload_pipeline import RequestSizeLimit
+
+    headers = [(b"content-type", b"multipart/form-data; boundary=x"), (b"content-length", b"5000")]
+    status, letti = _richiesta(lambda app: RequestSizeLimit(app, max_bytes=1000), headers, [b"x" * 5000])
+    assert status == 413
+    assert letti == 0
+
+
+def test_limite_su_corpo_chunked():
+    from core.upload_pipeline import RequestSizeLimit
+
+    headers = [(b"content-type", b"multipart/form-data; boundary=x")]
+    status, letti = _richiesta(lambda app: RequestSizeLimit(app, max_bytes=1000), headers, [b"x" * 600] * 10)
+    assert status == 413
+    assert letti <= 1200
+
+
+def test_corpo_entro_il_limite():
+    from core.upload_pipeline import RequestSizeLimit
+
+    headers = [(b"content-type", b"multipart/form-data; boundary=x")]
+    status, _ = _richiesta(lambda app: RequestSizeLimit(app, max_bytes=1000), headers, [b"x" * 400])
+    assert status == 200